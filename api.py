@@ -0,0 +1,141 @@
+"""
+Structured (JSON) lists of events, conferences and locations.
+
+Lists are served a page at a time in the order of a unique key, e.g.
+(startDate, instance) for events. Each page ends with a 'next' token (the
+key of its last row) and the following page is the rows after that key, so
+the database can seek straight to it however deep it is, which OFFSET can't.
+"""
+
+import datetime
+import json
+
+import db
+import feeds
+from query import Fields, Filter, Limit, Order, Select, Tables
+
+
+default_limit = 100
+max_limit = 1000
+
+
+class Resource:
+	"""
+	A list of things (e.g. events) that can be paged through.
+
+	'keys' are (name, column, converter) triples describing the unique key,
+	where 'name' is the key field's name in 'fields', 'column' is how to refer
+	to it in a WHERE clause and 'converter' parses it from a 'next' token.
+	'filters' turn query arguments into Filters (see page()).
+	"""
+
+	def __init__(self, fields, source, keys, filters = []):
+		self.fields = fields
+		self.source = source
+		self.keys = keys
+		self.filters = filters
+
+	def page(self, filter = Filter(None), after = None, limit = default_limit,
+			names = None):
+		"""
+		Up to 'limit' results after the key in token 'after' (if any), with
+		just the named fields (and the key fields) if 'names' is set.
+		"""
+		limit = max(1, min(int(limit), max_limit))
+
+		fields = self.fields
+		if names is not None:
+			key_names = [ name for (name, column, convert) in self.keys ]
+			fields = fields.project(key_names +
+				[ name for name in names if name not in key_names ])
+
+		if after is not None:
+			filter = filter & Filter.after(
+				[ column for (name, column, convert) in self.keys ],
+				self.parse(after))
+
+		results = db.execute(Select(
+			filter = filter,
+			order = Order(', '.join([ c for (n, c, convert) in self.keys ])),
+			fields = fields,
+			source = self.source,
+			limit = Limit(limit + 1)))
+
+		# We asked for one result more than we need to know if there's a next page.
+		next = None
+		if len(results) > limit:
+			results = results[:limit]
+			next = self.token(results[-1])
+
+		return {
+			'results': [ r.as_dict() for r in results ],
+			'next': next,
+		}
+
+	def token(self, row):
+		return ','.join([
+			value.isoformat() if isinstance(value, datetime.date) else str(value)
+				for value in [ getattr(row, n) for (n, c, convert) in self.keys ]
+		])
+
+	def parse(self, token):
+		values = token.split(',')
+		if len(values) != len(self.keys):
+			raise ValueError, "Invalid 'after' token: '%s'" % token
+
+		return [ convert(value)
+			for ((name, column, convert), value) in zip(self.keys, values) ]
+
+
+def page(resource, args):
+	"""
+	A page of a resource, as requested by query arguments 'args': 'after'
+	(a 'next' token), 'limit', 'fields' (comma-separated names) and any
+	that the resource's filters take.
+	"""
+	filter = Filter(None)
+	for f in resource.filters: filter = filter & f(args)
+
+	names = args.get('fields')
+	if names is not None: names = [ n.strip() for n in names.split(',') ]
+
+	return resource.page(filter,
+		after = args.get('after') or None,
+		limit = args.get('limit', default_limit),
+		names = names)
+
+
+def date(s):
+	return datetime.datetime.strptime(s, '%Y-%m-%d').date()
+
+def tag_filter(args):
+	""" Only conferences with any of the tags in the 'tags' argument. """
+	names = args.get('tags')
+	if not names: return Filter(None)
+	return Filter.tags(feeds.tag_ids([ n.strip() for n in names.split(',') ]))
+
+
+def date_filter(args):
+	""" Only events starting between the 'from' and 'to' arguments. """
+	(first, last) = (args.get('from'), args.get('to'))
+	return Filter.start_dates(
+		date(first) if first else None, date(last) if last else None)
+
+
+events = Resource(Fields.events(), Tables.events(),
+	[ ('startDate', 'startDate', date), ('instance', 'instance', int) ],
+	[ tag_filter, date_filter ])
+
+conferences = Resource(Fields.conference(), Tables.conference(),
+	[ ('conference', 'conference', int) ], [ tag_filter ])
+
+locations = Resource(Fields.locations(), Tables.locations(),
+	[ ('location_id', 'Locations.location', int) ])
+
+
+def encode(data):
+	return json.dumps(data, sort_keys = True, default = json_value)
+
+def json_value(value):
+	if isinstance(value, datetime.date): return value.isoformat()
+	raise TypeError, '%r is not JSON serializable' % value
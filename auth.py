@@ -1,6 +1,8 @@
 import flask
 import functools
+import time
 
+import cache
 import db
 
 
@@ -9,28 +11,51 @@ def authenticate(message = 'Login required'):
 			{'WWW-Authenticate': 'Basic realm="SECCONFDB"'})
 
 
-credentials = {
-	'database': 'secconfdb',
-	'username': 'secconfdb',
-	'password': '',
-}
+def credentials():
+	""" The current request's (verified) database credentials. """
+	return flask.g.credentials
+
+
+# Credentials that the database has accepted recently, so that a burst of
+# edits doesn't cost a connection handshake per request just to check them.
+# Entries are keyed by a salted hash of the password (see db.password_hash)
+# and expire after 'verified_ttl' seconds, so changing or revoking a password
+# takes up to that long to lock out its pooled connections.
+verified = cache.LRU(max_size = 256)
+verified_ttl = 60
+
+def credentials_key(credentials):
+	return (credentials['database'], credentials['username'],
+		db.password_hash(credentials['password']))
+
+def verify(credentials):
+	""" Check some credentials against the database (or a recent check). """
+	key = credentials_key(credentials)
+
+	checked = verified.get(key)
+	if checked is not None and time.time() - checked < verified_ttl: return
+
+	db.check_credentials(**credentials)
+	verified.put(key, time.time())
 
 
 def requires_auth(f):
 	""" Decorator which says "we need real credentials for this operation". """
 	@functools.wraps(f)
 	def decorated(*args, **kwargs):
-		global credentials
-
 		auth = flask.request.authorization
 		if not auth: return authenticate()
 
-		credentials.update(auth)
+		credentials = {
+			'database': 'secconfdb',
+			'username': auth.username,
+			'password': auth.password,
+		}
 
-		try: db.cursor(**credentials)
+		try: verify(credentials)
 		except db.UnauthorizedAccessException, message:
 			return authenticate(message)
 
+		flask.g.credentials = credentials
 		return f(*args, **kwargs)
 	return decorated
-
@@ -0,0 +1,190 @@
+"""
+Storage backends: where connections come from and how to talk to them.
+
+Each backend opens MySQLdb-style connections and names the SQL dialect
+(see query.Dialect) that queries sent to it must be written in.
+"""
+
+import os
+import sqlite3
+
+try:
+	import MySQLdb
+	import MySQLdb.cursors
+	MySQLError = MySQLdb.OperationalError
+
+except ImportError:
+	# Nodes that only serve reads from an SQLite file don't need it.
+	MySQLdb = None
+	class MySQLError(Exception): pass
+
+import query
+
+
+class MySQL:
+	""" A MySQL server (the primary database). """
+
+	dialect = query.Dialect.mysql
+	Error = MySQLError
+
+	def __init__(self, host = 'localhost'):
+		self.host = host
+		self.streaming_cursor = MySQLdb.cursors.SSCursor if MySQLdb else None
+
+	def connect(self, database, username, password):
+		if MySQLdb is None: raise ImportError('MySQLdb is not installed')
+
+		connection = MySQLdb.connect(
+			host = self.host, db = database, user = username, passwd = password)
+
+		connection.cursor().execute("""
+				SET NAMES utf8;
+				SET CHARACTER SET utf8;
+				SET character_set_connection=utf8;
+			""")
+
+		return connection
+
+	def denied(self, error):
+		""" If 'error' means "access denied", the message (else None). """
+		(errno, message) = error.args[:2]
+		if errno in (1044, 1045, 1142): return message
+		else: return None
+
+	def __str__(self):
+		return 'mysql://%s' % self.host
+
+
+class SQLite:
+	"""
+	An SQLite database file, e.g. a local copy of the data for a node that
+	only serves reads.
+
+	SQLite has no accounts, so a read-only database (the default) refuses
+	connections with any credentials but the default (anonymous) ones and
+	a writable one accepts them all: only use those for tests and benchmarks.
+	"""
+
+	dialect = query.Dialect.sqlite
+	Error = sqlite3.Error
+	streaming_cursor = None
+
+	schema = os.path.join(
+		os.path.dirname(os.path.abspath(__file__)), 'schema', 'sqlite.sql')
+
+	def __init__(self, filename, writable = False):
+		self.filename = filename
+		self.writable = writable
+
+		# How many statements have been executed (e.g. for benchmarks).
+		self.statements = 0
+
+	@classmethod
+	def create(cls, filename):
+		""" Create an empty database (with the schema) in a file. """
+		if os.path.exists(filename): os.remove(filename)
+
+		connection = sqlite3.connect(filename)
+		connection.executescript(open(cls.schema).read())
+		connection.commit()
+		connection.close()
+
+		return cls(filename, writable = True)
+
+	def connect(self, database, username, password):
+		if not self.writable and username != 'secconfdb':
+			raise sqlite3.OperationalError(
+				'%s is a read-only copy of the database' % self.filename)
+
+		return SQLiteConnection(self, self.filename)
+
+	def denied(self, error):
+		message = str(error)
+		if 'read-only' in message or 'readonly' in message: return message
+		else: return None
+
+	def __str__(self):
+		return 'sqlite://%s' % self.filename
+
+
+class SQLiteConnection:
+	""" A MySQLdb-style wrapper around an SQLite connection. """
+
+	def __init__(self, backend, filename):
+		self.backend = backend
+
+		self.connection = sqlite3.connect(filename,
+			detect_types = sqlite3.PARSE_DECLTYPES, check_same_thread = False)
+
+		# MySQLdb returns (UTF-8) byte strings.
+		self.connection.text_factory = str
+
+		if not backend.writable:
+			self.connection.execute('PRAGMA query_only = ON')
+
+	def cursor(self, cursor_class = None):
+		return SQLiteCursor(self)
+
+	def commit(self): self.connection.commit()
+	def rollback(self): self.connection.rollback()
+	def close(self): self.connection.close()
+	def ping(self): pass
+
+
+class SQLiteCursor:
+	"""
+	A MySQLdb-style cursor: %s parameters, several ';\\n'-separated
+	statements in one execute() (see query.Batch) and nextset().
+	"""
+
+	def __init__(self, connection):
+		self.connection = connection
+		self.dialect = connection.backend.dialect
+		self.cursor = connection.connection.cursor()
+
+		self.results = []
+		self.rows = []
+		self.position = 0
+		self.description = None
+		self.rowcount = -1
+		self.lastrowid = None
+
+	def execute(self, sql, params = ()):
+		params = list(params or ())
+		self.results = []
+
+		for statement in sql.split(';\n'):
+			count = statement.count('%s')
+			(args, params) = (params[:count], params[count:])
+
+			self.connection.backend.statements += 1
+			self.cursor.execute(
+				statement.replace('%s', '?').replace('%%', '%'), args)
+
+			self.results.append(
+				(self.cursor.description, self.cursor.fetchall()))
+
+		self.lastrowid = self.cursor.lastrowid
+		self.nextset()
+
+		return len(self.rows)
+
+	def nextset(self):
+		if len(self.results) == 0: return None
+
+		(self.description, self.rows) = self.results.pop(0)
+		self.rowcount = len(self.rows)
+		self.position = 0
+		return True
+
+	def fetchone(self):
+		rows = self.fetchmany(1)
+		return rows[0] if rows else None
+
+	def fetchmany(self, size = 1):
+		rows = self.rows[self.position:self.position + size]
+		self.position += len(rows)
+		return rows
+
+	def fetchall(self):
+		return self.fetchmany(len(self.rows))
@@ -0,0 +1,134 @@
+"""
+Synthetic conference data at a configurable scale.
+
+generate(connection, instances) fills an empty SQLite database (see
+schema/sqlite.sql) with countries, regions, locations, tags, conferences and
+'instances' conference instances spread over the last ten years (and the
+next one).
+The same seed always produces the same data.
+"""
+
+import datetime
+import random
+
+
+def generate(connection, instances, seed = 42):
+	""" Fill a database; returns the abbreviations of the conferences. """
+	rand = random.Random(seed)
+	cursor = connection.cursor()
+
+	# Sizes of the other tables scale (slowly) with the number of instances.
+	conference_count = max(10, instances // 20)
+	location_count = max(20, min(instances // 10, 20000))
+	country_count = 50
+	region_count = 200
+	tag_count = 30
+
+	insert(cursor, 'Countries', [ 'country', 'code', 'name' ], [
+		(i, 'C%d' % i, 'Country %d' % i) for i in range(1, country_count + 1)
+	])
+
+	insert(cursor, 'Regions', [ 'region', 'country', 'code', 'name' ], [
+		(i, rand.randint(1, country_count), 'R%d' % i, 'Region %d' % i)
+			for i in range(1, region_count + 1)
+	])
+
+	# Locations are in either a region or (directly) a country.
+	locations = []
+	for i in range(1, location_count + 1):
+		if rand.random() < 0.5:
+			locations.append((i, 'City %d' % i, rand.randint(1, region_count), None))
+		else:
+			locations.append((i, 'City %d' % i, None, rand.randint(1, country_count)))
+
+	insert(cursor, 'Locations', [ 'location', 'name', 'region', 'country' ],
+		locations)
+
+	insert(cursor, 'Tags', [ 'tag', 'name' ], [
+		(i, 'tag%d' % i) for i in range(1, tag_count + 1)
+	])
+	insert(cursor, 'Tags', [ 'tag', 'name' ], [
+		(tag_count + 1, 'security'), (tag_count + 2, 'privacy'),
+		(tag_count + 3, 'crypto'),
+	])
+	tag_count += 3
+
+	insert(cursor, 'MeetingTypes', [ '`meeting-type`', 'name' ], [
+		(1, 'Conference'), (2, 'Workshop'), (3, 'Symposium'),
+	])
+
+	conferences = []
+	conference_tags = []
+	for i in range(1, conference_count + 1):
+		tags = sorted(rand.sample(range(1, tag_count + 1), rand.randint(1, 4)))
+		parent = rand.randint(1, i - 1) if i > 1 and rand.random() < 0.1 else None
+
+		conferences.append((
+			i, parent, 'Conference on Synthetic Topics %d' % i, 'CONF%d' % i,
+			'A synthetic conference, number %d.' % i,
+			'http://conf%d.example.org/' % i, rand.randint(1, 3),
+			','.join([ str(t) for t in tags ]),
+		))
+		conference_tags += [ (i, t) for t in tags ]
+
+	insert(cursor, 'Conferences', [
+			'conference', 'parent', 'name', 'abbreviation', 'description',
+			'permanentURL', '`meeting-type`', 'tags'
+		], conferences)
+
+	insert(cursor, 'ConferenceTags', [ 'conference', 'tag' ], conference_tags)
+
+	today = datetime.date.today()
+	rows = []
+	for i in range(1, instances + 1):
+		start = today + datetime.timedelta(rand.randint(-3650, 400))
+		deadline = start - datetime.timedelta(rand.randint(60, 200))
+		extended = maybe(rand, deadline + datetime.timedelta(rand.randint(3, 14)))
+		poster = maybe(rand, start - datetime.timedelta(rand.randint(20, 50)))
+
+		rows.append((
+			i, rand.randint(1, conference_count),
+			'http://conf.example.org/%d/' % i,
+			start, start + datetime.timedelta(rand.randint(0, 4)),
+			deadline, extended, poster, extended or deadline,
+			rand.randint(1, location_count),
+			maybe(rand, 'http://dl.example.org/proceedings/%d' % i),
+		))
+
+		if len(rows) == 10000:
+			insert_instances(cursor, rows)
+			rows = []
+
+	insert_instances(cursor, rows)
+
+	cursor.execute("""
+		UPDATE Conferences SET latestInstance = (
+			SELECT instance FROM ConferenceInstances AS ci
+				WHERE ci.conference = Conferences.conference
+				ORDER BY startDate DESC, instance DESC
+				LIMIT 1)
+	""")
+
+	connection.commit()
+	return [ c[3] for c in conferences ]
+
+
+def maybe(rand, value):
+	return value if rand.random() < 0.6 else None
+
+
+def insert(cursor, table, fields, rows):
+	if len(rows) == 0: return
+
+	cursor.connection.executemany(
+		'INSERT INTO %s (%s) VALUES (%s)' % (
+			table, ','.join(fields), ','.join([ '?' ] * len(fields))),
+		rows)
+
+
+def insert_instances(cursor, rows):
+	insert(cursor, 'ConferenceInstances', [
+			'instance', 'conference', 'url', 'startDate', 'endDate',
+			'deadline', 'extendedDeadline', 'posterDeadline',
+			'effectiveDeadline', 'location', 'proceedings'
+		], rows)
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+"""
+Micro-benchmark: the per-row cost of displaying events.
+
+Builds a few thousand synthetic rows with the Fields.events() projection
+and times the display calls that the event_row macro (and then an .ics
+feed) makes for each one, before and after memoizing the display fields.
+If Jinja2 is available, it also times rendering the real event_table macro.
+
+Usage: benchmarks/event_rows.py [rows] [repetitions]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import event
+import query
+
+
+def synthetic_rows(count, seed = 42):
+	""" Rows which look like the results of a Fields.events() query. """
+	generate = random.Random(seed)
+	row = event.row_class(query.Fields.events().names())
+	today = datetime.date.today()
+
+	def some_date(): return today + datetime.timedelta(generate.randint(-400, 400))
+	def maybe(value): return value if generate.random() < 0.5 else None
+
+	rows = []
+	for i in xrange(count):
+		start = some_date()
+		rows.append(row(
+			i,
+			'http://conf%d.example.org/' % i, i % 200, 'CONF%d' % (i % 200),
+			'Conference on Things %d' % i,
+			start, start + datetime.timedelta(generate.randint(0, 4)),
+			some_date(), maybe(some_date()), maybe(some_date()),
+			i % 50, 'Z\xc3\xbcrich', maybe('Canton Z\xc3\xbcrich'), 'ZH', 'CH',
+			maybe('http://dl.example.org/proceedings/%d' % i),
+			'http://conf%d.example.org/' % (i % 200),
+		))
+
+	return rows
+
+
+def display(row):
+	""" The display calls made for one row by event_row and a feed. """
+	if row.extendedDeadline: row.format_deadline("extended")
+	row.format_deadline()
+	row.format_deadline("poster")
+	row.when()
+	row.where()
+
+	# The .ics feeds want the location again.
+	row.where()
+
+
+# The display methods as they were before memoization (and faster date
+# formatting), for comparison.
+def original_when(self):
+	if not hasattr(self, 'startDate'): return None
+
+	start = self.startDate
+	end = self.endDate
+
+	s = None
+
+	if start.year != end.year: s = start.strftime("%d %b %Y").lstrip("0")
+	elif start.month != end.month: s = start.strftime("%d %b").lstrip("0")
+	elif start.day != end.day: s = str(start.day)
+
+	if s is None: s = ""
+	else: s += "-"
+
+	s += end.strftime("%d %b %Y").lstrip("0")
+	return s
+
+def original_where(self):
+	location = (self.location, self.region, self.country)
+	return ", ".join(
+		[ unicode(i, "utf8") for i in location if i is not None ])
+
+def original_format_deadline(self, which = None):
+	date = None
+	if which is None: date = self.deadline
+	else: date = getattr(self, which + "Deadline")
+
+	if date is None: return ""
+	return date.strftime("%d %b %Y").lstrip("0")
+
+
+current = dict([
+	(name, getattr(event.Row, name))
+		for name in [ 'when', 'where', 'format_deadline' ]
+])
+
+def original():
+	""" Swap the original display methods into Row. """
+	event.Row.when = original_when
+	event.Row.where = original_where
+	event.Row.format_deadline = original_format_deadline
+
+def memoized():
+	for (name, method) in current.items(): setattr(event.Row, name, method)
+
+
+def best_of(repetitions, f):
+	""" Best wall-clock time of several runs of 'f' (given fresh rows). """
+	times = []
+	for i in range(repetitions):
+		args = f.setup()
+		start = time.time()
+		f(*args)
+		times.append(time.time() - start)
+
+	return min(times)
+
+
+def benchmark(count, repetitions):
+	results = []
+
+	def display_all(rows):
+		for row in rows: display(row)
+	display_all.setup = lambda: (synthetic_rows(count),)
+
+	render = None
+	try:
+		import jinja2
+
+		class Utils:
+			""" The parts of utils that event_row uses (without Flask). """
+			@staticmethod
+			def soonness(date, thresholds = [ 0, 7, 28, 90 ]):
+				if date is None: return "dateUnspecified"
+				days_left = (date - datetime.date.today()).days
+				classes = [ 'tooLate', 'reallySoon', 'soon', 'notSoon' ]
+				for (days, category) in zip(thresholds, classes):
+					if days_left < days: return category
+				return ""
+
+		environment = jinja2.Environment(
+			loader = jinja2.FileSystemLoader(os.path.join(root, 'templates')))
+		macros = environment.get_template('event.html').module
+
+		def render(rows):
+			macros.event_table(rows, show_deadlines = True, utils = Utils)
+			for row in rows: row.where()
+		render.setup = lambda: (synthetic_rows(count),)
+
+	except ImportError:
+		pass
+
+	for (label, setup) in (('before', original), ('after', memoized)):
+		setup()
+		results.append((label, 'display calls',
+			best_of(repetitions, display_all)))
+
+		if render:
+			results.append((label, 'event_table render',
+				best_of(repetitions, render)))
+
+	return results
+
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+	repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+	print '%d rows, best of %d runs' % (count, repetitions)
+	for (label, what, elapsed) in benchmark(count, repetitions):
+		print '%-7s %-20s %8.2f ms  %6.2f us/row' % (
+			label, what, elapsed * 1000, elapsed / count * 1e6)
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+"""
+Benchmark the site's main routes against synthetic data.
+
+For each scale (number of conference instances), this generates an SQLite
+database (see backend.SQLite), drives each route through Flask's test client and reports the
+p50/p99 latency, the number of queries per request and the growth in peak
+memory, as JSON (for comparison across commits).
+
+Each route is measured "cold", with every in-process cache and connection
+dropped before each request (as in a freshly started process), and "warm",
+with caches left alone. Each measurement runs in a process of its own, so
+that its peak memory (a high-water mark for the whole process) is the
+route's own rather than that of whatever ran before it.
+
+Usage: benchmarks/routes.py [--scales 1000,10000] [--requests 50]
+                            [--output results.json] [--workdir /tmp]
+"""
+
+import json
+import optparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+os.chdir(root)
+
+import backend
+import confdb
+import db
+import query
+
+import dataset
+
+
+def routes(abbreviations, rand):
+	""" The routes to measure: (name, function returning a URL). """
+	return [
+		('/', lambda: '/'),
+		('/conference/<abbreviation>',
+			lambda: '/conference/%s' % rand.choice(abbreviations)),
+		('/most_recent', lambda: '/most_recent'),
+		('/conferences.ics', lambda: '/conferences.ics'),
+		('/deadlines.ics', lambda: '/deadlines.ics'),
+	]
+
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[int(round(fraction * (len(values) - 1)))]
+
+
+def peak_rss_kb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reset(database):
+	""" Drop every in-process cache and connection, as in a new process. """
+	db.configure(database)
+	query.compiled.clear()
+
+
+def measure(client, database, url, requests, cold):
+	""" Time 'requests' GETs of the URLs produced by 'url'. """
+	times = []
+	statements = 0
+
+	# Warm requests are measured from a warmed-up state.
+	if not cold: client.get(url()).data
+	rss = peak_rss_kb()
+
+	for i in range(requests):
+		if cold: reset(database)
+
+		before = database.statements
+		start = time.time()
+
+		response = client.get(url())
+		body = response.data
+
+		times.append(time.time() - start)
+		statements += database.statements - before
+
+		assert response.status_code in (200, 404), response.status
+
+	return {
+		'p50_ms': percentile(times, 0.5) * 1000,
+		'p99_ms': percentile(times, 0.99) * 1000,
+		'mean_ms': sum(times) / len(times) * 1000,
+		'queries_per_request': float(statements) / requests,
+		'peak_rss_kb': peak_rss_kb(),
+		'peak_rss_growth_kb': peak_rss_kb() - rss,
+	}
+
+
+def measure_route(filename, name, requests, cold):
+	""" Measure one route (in this process, which should be a new one). """
+	database = backend.SQLite(filename)
+
+	connection = database.connect('secconfdb', 'secconfdb', '').connection
+	abbreviations = [ row[0] for row in
+		connection.execute('SELECT abbreviation FROM Conferences') ]
+	connection.close()
+
+	# Serve from the database (read-only, like a web node would).
+	reset(database)
+
+	client = confdb.app.test_client()
+	rand = random.Random(len(abbreviations))
+	url = dict(routes(abbreviations, rand))[name]
+
+	return measure(client, database, url, requests, cold)
+
+
+def run(instances, requests, workdir):
+	filename = os.path.join(workdir, 'secconfdb-%d.sqlite' % instances)
+	database = backend.SQLite.create(filename)
+
+	start = time.time()
+	connection = database.connect('secconfdb', 'secconfdb', '').connection
+	abbreviations = dataset.generate(connection, instances)
+	connection.close()
+	generated = time.time() - start
+
+	results = {}
+	for name in [ name for (name, url) in routes(abbreviations, None) ]:
+		results[name] = dict([
+			(mode, json.loads(subprocess.check_output([
+				sys.executable, os.path.abspath(__file__),
+				'--measure', name, '--' + mode,
+				'--database', filename, '--requests', str(requests) ])))
+			for mode in ('cold', 'warm')
+		])
+
+	return {
+		'instances': instances,
+		'conferences': len(abbreviations),
+		'generation_s': generated,
+		'generation_peak_rss_kb': peak_rss_kb(),
+		'routes': results,
+	}
+
+
+def revision():
+	try:
+		return subprocess.check_output(
+			[ 'git', 'rev-parse', '--short', 'HEAD' ], cwd = root).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser()
+	parser.add_option('--scales', default = '1000,10000',
+		help = 'numbers of conference instances (comma-separated)')
+	parser.add_option('--requests', type = 'int', default = 50,
+		help = 'requests per route')
+	parser.add_option('--output', help = 'JSON output file (default: stdout)')
+	parser.add_option('--workdir', default = tempfile.gettempdir(),
+		help = 'where to put the SQLite databases')
+
+	# How run() measures each route in a process of its own.
+	parser.add_option('--measure', help = optparse.SUPPRESS_HELP)
+	parser.add_option('--database', help = optparse.SUPPRESS_HELP)
+	parser.add_option('--cold', action = 'store_true', default = False,
+		help = optparse.SUPPRESS_HELP)
+	parser.add_option('--warm', action = 'store_false', dest = 'cold',
+		help = optparse.SUPPRESS_HELP)
+
+	(options, args) = parser.parse_args()
+
+	if options.measure:
+		print json.dumps(measure_route(options.database, options.measure,
+			options.requests, options.cold))
+		sys.exit(0)
+
+	report = {
+		'revision': revision(),
+		'python': sys.version.split()[0],
+		'requests': options.requests,
+		'scales': [
+			run(int(scale), options.requests, options.workdir)
+				for scale in options.scales.split(',')
+		],
+	}
+
+	output = json.dumps(report, indent = 2, sort_keys = True)
+	if options.output: open(options.output, 'w').write(output + '\n')
+	else: print output
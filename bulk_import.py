@@ -0,0 +1,160 @@
+#!/usr/bin/python
+"""
+Load many conferences and conference instances (e.g. a season of CFPs).
+
+Usage: bulk_import.py [--user USERNAME] [--conferences FILE] [--instances FILE]
+
+Each FILE is CSV (with a header row) or JSON (a list of objects or one object
+per line) with the same fields as the editing forms:
+
+  conferences: abbrev, name, desc, url, type, tags (names) and parent
+               (the abbreviation of an existing conference)
+  instances:   conference (the abbreviation of a new or existing conference),
+               start, end, deadline, extended, poster, url, proc and location
+
+Every row is checked before anything is written; then all of them are
+loaded in one transaction, which also bumps the shared data version (see
+db.data_version). Running servers notice that within db.version_ttl seconds
+and drop what they have cached: pages, feeds, ETags, reference data and the
+search index.
+"""
+
+import csv
+import getpass
+import itertools
+import json
+import optparse
+import sys
+import time
+
+import confdb
+import db
+
+
+# Input field -> (converter, database field), as in confdb's editing forms.
+conference_fields = {
+	'name':       (unicode,       'name'),
+	'abbrev':     (confdb.abbrev, 'abbreviation'),
+	'type':       (int,           '`meeting-type`'),
+	'parent':     (confdb.abbrev, 'parent'),
+	'url':        (confdb.url,    'permanentURL'),
+	'desc':       (unicode,       'description'),
+	'tags':       (confdb.tags,   'tags'),
+}
+
+instance_fields = {
+	'conference': (confdb.abbrev, 'conference'),
+	'start':      (confdb.date,   'startDate'),
+	'end':        (confdb.date,   'endDate'),
+	'deadline':   (confdb.date,   'deadline'),
+	'extended':   (confdb.date,   'extendedDeadline'),
+	'poster':     (confdb.date,   'posterDeadline'),
+	'url':        (confdb.url,    'url'),
+	'proc':       (confdb.url,    'proceedings'),
+	'location':   (int,           'location'),
+}
+
+
+def read(filename):
+	""" Generate rows (dictionaries of strings) from a CSV or JSON file. """
+	f = open(filename)
+
+	if filename.endswith('.csv'):
+		for row in csv.DictReader(f):
+			yield dict([ (name, value.decode('utf8'))
+				for (name, value) in row.items() if value is not None ])
+		return
+
+	first = f.readline()
+	if first.lstrip().startswith('['):
+		rows = json.loads(first + f.read())
+	else:
+		rows = ( json.loads(line) for line in itertools.chain([ first ], f)
+			if len(line.strip()) > 0 )
+
+	for row in rows: yield row
+
+
+def convert(rows, fields, what):
+	""" Check and convert rows with the editing forms' converters. """
+	converted = []
+
+	for (n, row) in enumerate(rows):
+		values = {}
+
+		for (name, (type_converter, field_name)) in fields.items():
+			value = row.get(name)
+			if value is None or len(unicode(value)) == 0:
+				values[field_name] = None
+				continue
+
+			try: values[field_name] = type_converter(unicode(value))
+			except ValueError, e:
+				raise ValueError, '%s %d: %s' % (what, n + 1, e)
+
+		converted.append(values)
+
+	return converted
+
+
+def load(conference_file, instance_file, credentials):
+	start = time.time()
+
+	conferences = []
+	if conference_file:
+		conferences = convert(read(conference_file), conference_fields,
+			'conference')
+
+	instances = []
+	if instance_file:
+		instances = convert(read(instance_file), instance_fields, 'instance')
+
+	existing = dict([ (c.abbreviation, c.conference) for c in db.conferences() ])
+
+	for (n, conference) in enumerate(conferences):
+		if conference['abbreviation'] is None:
+			raise ValueError, 'conference %d: no abbreviation' % (n + 1)
+
+		parent = conference['parent']
+		if parent is not None:
+			if parent not in existing:
+				raise ValueError, "conference %d: no such parent: '%s'" % (
+					n + 1, parent)
+
+			conference['parent'] = existing[parent]
+
+	for (n, instance) in enumerate(instances):
+		if instance['conference'] is None:
+			raise ValueError, 'instance %d: no conference' % (n + 1)
+
+	checked = time.time()
+	print 'Checked %d conferences and %d instances in %.2f s' % (
+		len(conferences), len(instances), checked - start)
+
+	db.bulk_create(conferences, instances, credentials)
+
+	rows = len(conferences) + len(instances)
+	elapsed = time.time() - checked
+	print 'Loaded %d rows in %.2f s (%.0f rows/s)' % (
+		rows, elapsed, rows / max(elapsed, 1e-6))
+
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser(
+		usage = '%prog [--user USERNAME] [--conferences FILE] [--instances FILE]')
+	parser.add_option('--user', default = getpass.getuser(),
+		help = 'database account to load the data as')
+	parser.add_option('--conferences', help = 'CSV or JSON file of conferences')
+	parser.add_option('--instances', help = 'CSV or JSON file of instances')
+
+	(options, args) = parser.parse_args()
+	if not options.conferences and not options.instances:
+		parser.error('nothing to import')
+
+	password = getpass.getpass('Password for %s: ' % options.user)
+	credentials = { 'username': options.user, 'password': password }
+
+	try: load(options.conferences, options.instances, credentials)
+	except (ValueError, db.UnauthorizedAccessException), e:
+		print >> sys.stderr, 'Nothing imported: %s' % e
+		sys.exit(1)
@@ -0,0 +1,52 @@
+import collections
+import threading
+
+
+class LRU:
+	""" A bounded, thread-safe cache which evicts the least recently used entry.
+
+	Each clear() starts a new generation; a value computed from data read
+	before the most recent clear() can be dropped by passing the generation
+	it was computed in to put().
+	"""
+
+	def __init__(self, max_size):
+		assert max_size > 0
+
+		self.max_size = max_size
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.generation = 0
+
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, default = None):
+		with self.lock:
+			if key not in self.entries:
+				self.misses += 1
+				return default
+
+			self.hits += 1
+			value = self.entries.pop(key)
+			self.entries[key] = value
+			return value
+
+	def put(self, key, value, generation = None):
+		with self.lock:
+			if generation is not None and generation != self.generation: return
+
+			self.entries.pop(key, None)
+			self.entries[key] = value
+
+			while len(self.entries) > self.max_size:
+				self.entries.popitem(last = False)
+
+	def clear(self, *args):
+		""" Drop everything (may be used directly as a db.on_write hook). """
+		with self.lock:
+			self.entries.clear()
+			self.generation += 1
+
+	def __len__(self):
+		return len(self.entries)
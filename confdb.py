@@ -5,37 +5,121 @@ import db
 import flask
 import re
 
+import api
 import auth
+import cache
+import feeds
+import metrics
+import search
 import utils
 
 app = flask.Flask(__name__)
 
 
+# Read-your-writes: a client that has just edited something reads from the
+# primary database until the replica (if any) has had time to catch up, even
+# from workers that haven't yet seen the new data version (see db.route).
+@app.before_request
+def route_reads():
+	try: last_write = float(flask.request.cookies.get('wrote', ''))
+	except ValueError: last_write = None
+
+	db.start_request(last_write)
+
+@app.after_request
+def remember_writes(response):
+	last_write = db.last_write()
+	if last_write is not None:
+		response.set_cookie('wrote', '%d' % last_write, max_age = db.replica_lag)
+
+	return response
+
+
+# Instrumentation (see metrics.py).
+@app.before_request
+def start_timing():
+	rule = flask.request.url_rule
+	metrics.start_request(rule.rule if rule else flask.request.path)
+
+@app.after_request
+def report_timing(response):
+	# A streamed body (e.g. an .ics feed) is only queried for as it's sent, so
+	# the header can't include that; the totals for /metrics still do.
+	if response.is_streamed:
+		timing = metrics.server_timing()
+		if timing is not None:
+			response.response = metrics.finish_after(response.response)
+	else:
+		timing = metrics.finish_request()
+
+	if timing is not None: response.headers['Server-Timing'] = timing
+
+	return response
+
+# Only scrapers on this host may see the metrics.
+metrics_clients = [ '127.0.0.1', '::1' ]
+
+@app.route('/metrics')
+def prometheus_metrics():
+	if flask.request.remote_addr not in metrics_clients: flask.abort(404)
+
+	gauges = {}
+	for ((role, account), stats) in sorted(db.pool_stats().items()):
+		labels = [ 'backend="%s"' % role, 'account="%s"' % account ]
+		for stat in ('size', 'in_use', 'waits'):
+			gauges.setdefault('secconfdb_pool_%s' % stat, []).append(
+				(labels, stats[stat]))
+
+	return flask.Response(metrics.totals.exposition(gauges),
+		mimetype = 'text/plain; version=0.0.4')
+
+
+# Rendered front pages, keyed by tag set, data version (see db.data_version,
+# which changes with writes from any process and at midnight) and host name.
+front_pages = cache.LRU(max_size = 64)
+db.on_write(front_pages.clear)
+
 @app.route('/')
+@utils.conditional(vary = utils.front_page_variant)
 def main():
 	""" Main "entry point" for the site. """
 
 	# What tags are we using to filter results?
 	tag_names = utils.tags()
+
+	# Every visitor with the same filters gets the same page (until the data
+	# change).
+	(version, modified) = db.data_version()
+	key = (tuple(tag_names), version, flask.request.host)
+	page = front_pages.get(key)
+	if page is not None: return page
+
+	generation = front_pages.generation
 	current_tags = [ id for (id, name) in db.get_tags(tag_names) ]
 	if len(tag_names) == 0: tag_names = None
 
+	(deadlines, upcoming, recent) = db.front_page(current_tags)
+
 	# Render from the 'main' template.
-	return flask.render_template('main.html',
+	page = utils.render_template('main.html',
 			tags = tag_names,
-			deadlines = db.deadlines(current_tags),
-			upcoming = db.upcoming(current_tags),
-			recent = db.recent(current_tags),
+			deadlines = deadlines,
+			upcoming = upcoming,
+			recent = recent,
 			utils = utils)
 
+	front_pages.put(key, page, generation)
+	return page
+
 
 @app.route('/conference/<string:abbreviation>')
+@utils.conditional()
 def conference(abbreviation):
 	""" Render information about a particular conference (e.g. all events). """
 	(conference, events) = db.conference_events(abbreviation = abbreviation)
 	if len(events) == 0: flask.abort(404)
 
-	return flask.render_template('conference.html',
+	return utils.render_template('conference.html',
 		conference = conference,
 		events = events,
 		utils = utils)
@@ -45,7 +129,7 @@ def conference(abbreviation):
 @app.route('/preferences')
 def prefs():
 	""" Ask the user for preferences. """
-	return flask.render_template('prefs.html',
+	return utils.render_template('prefs.html',
 			all_tags = db.get_tags(),
 			current_tags = utils.tags()
 		)
@@ -69,65 +153,100 @@ def setprefs():
 @app.route('/most_recent')
 def most_recent():
 	""" What conferences do we need to update? """
-	return flask.render_template('most_recent.html',
+	return utils.render_template('most_recent.html',
 			conferences = db.most_recent(),
 			utils = utils)
 
 
 # vCal files for upcoming conferences and deadlines.
 @app.route('/conferences.ics')
+@utils.conditional()
 def conference_calendar():
 	""" A vCal file of upcoming conferences. """
-	events = [
-		(
-			event.abbreviation, event.name, event.where(),
-			(event.startDate, event.endDate)
-		)
-		for event in db.upcoming()
-	]
-
-	return utils.make_vcal(events, 'Upcoming Conferences')
+	return utils.make_vcal(
+		feeds.dates(db.upcoming(stream = True)), 'Upcoming Conferences')
 
 @app.route('/deadlines.ics')
+@utils.conditional()
 def deadline_calendar():
 	""" A vCal file of impending deadlines. """
-	events = []
-	for conf in db.deadlines():
-		# Use extended paper deadline if it exists, or the original otherwise.
-		if conf.extendedDeadline:
-			events.append(
-				(
-					"%s Deadline (extended)" % conf.abbreviation,
-					"Extended paper deadline for %s" % conf.name,
-					conf.where(),
-					conf.extendedDeadline,
-				))
-		elif conf.deadline:
-			events.append(
-				(
-					"%s Deadline" % conf.abbreviation,
-					"Paper deadline for %s" % conf.name,
-					conf.where(),
-					conf.deadline,
-				))
-
-		# A conference may also have a poster deadline.
-		if conf.posterDeadline:
-			events.append(
-				(
-					"%s Poster Deadline" % conf.abbreviation,
-					"Poster deadline for %s" % conf.name,
-					conf.where(),
-					conf.posterDeadline,
-				))
-
-	return utils.make_vcal(events, 'Conference Deadlines')
+	return utils.make_vcal(
+		feeds.deadlines(db.deadlines(stream = True)), 'Conference Deadlines')
+
+
+# Filtered vCal files, served from the feed store.
+feed_store = feeds.FeedStore()
+
+@app.route('/feeds/<string:tag_names>/conferences.ics')
+@utils.conditional()
+def filtered_conference_calendar(tag_names):
+	""" A vCal file of upcoming conferences with some tags. """
+	return utils.vcal_response(
+		feed_store.conferences(feed_tags(tag_names)))
+
+@app.route('/feeds/<string:tag_names>/deadlines.ics')
+@utils.conditional()
+def filtered_deadline_calendar(tag_names):
+	""" A vCal file of impending deadlines for conferences with some tags. """
+	return utils.vcal_response(
+		feed_store.deadlines(feed_tags(tag_names)))
+
+@app.route('/feeds/conference/<string:abbreviation>.ics')
+@utils.conditional()
+def conference_feed(abbreviation):
+	""" A vCal file of every instance of one conference. """
+	try: return utils.vcal_response(feed_store.conference(abbrev(abbreviation)))
+	except (KeyError, ValueError): flask.abort(404)
+
+def feed_tags(tag_names):
+	if not valid_tags.match(tag_names): flask.abort(404)
+	return [ name.strip() for name in tag_names.split(',') ]
+
+
+# Structured data, a page at a time (see api.py).
+@app.route('/api/events.json')
+@utils.conditional()
+def api_events():
+	""" Conference instances, optionally filtered by tags and start date. """
+	return api_page(api.events)
+
+@app.route('/api/conferences.json')
+@utils.conditional()
+def api_conferences():
+	""" Conferences, optionally filtered by tags. """
+	return api_page(api.conferences)
+
+@app.route('/api/locations.json')
+@utils.conditional()
+def api_locations():
+	return api_page(api.locations)
+
+def api_page(resource):
+	try:
+		return utils.json_response(
+			api.encode(api.page(resource, flask.request.args)))
+
+	except ValueError, e:
+		flask.abort(400, e)
+
+
+@app.route('/search.json')
+@utils.conditional()
+def search_conferences():
+	""" Conferences matching (words or word prefixes in) the 'q' argument. """
+	args = flask.request.args
+
+	try: limit = max(1, min(int(args.get('limit', 10)), 100))
+	except ValueError, e: flask.abort(400, e)
+
+	return utils.json_response(
+		api.encode(search.index.search(args.get('q', ''), limit)))
 
 
 
 @app.route('/edit')
 def edit_menu():
-	return flask.render_template('edit/list.html',
+	return utils.render_template('edit/list.html',
 			conferences = db.conferences(),
 			simple_tables = [
 				'Conferences',
@@ -153,7 +272,7 @@ def edit_conference(abbreviation):
 
 	meeting_types = [ (m.type_id, m.name) for m in db.meeting_types() ]
 
-	return flask.render_template('edit/conference.html',
+	return utils.render_template('edit/conference.html',
 			all_tags = [ name for (id, name) in db.get_tags() ],
 			conferences = conferences,
 			conference = conference,
@@ -179,9 +298,6 @@ def abbrev(s):
 	if valid_abbrev.match(s): return s
 	else: raise ValueError, "'%s' is not a valid conference abbreviation" % s
 
-def text(s):
-	return s.replace("'", "\\'")
-
 valid_tags = re.compile('[a-z0-9 ,]+$')
 def tags(s):
 	if valid_tags.match(s):
@@ -224,7 +340,7 @@ def create_event():
 
 	try:
 		db.create('ConferenceInstances', values = new_value,
-				credentials = auth.credentials)
+				credentials = auth.credentials())
 
 	except db.UnauthorizedAccessException, message:
 		return auth.authenticate(message)
@@ -263,7 +379,7 @@ def update_event():
 
 	try:
 		db.update('ConferenceInstances', key = ('instance', int(posted['id'])),
-				values = new_value, credentials = auth.credentials)
+				values = new_value, credentials = auth.credentials())
 
 	except db.UnauthorizedAccessException, message:
 		return auth.authenticate(message)
@@ -279,13 +395,13 @@ def update_conference():
 
 	# POST form -> SQL mapping
 	fields = {
-		'name':      (str,    'name'),
-		'abbrev':    (abbrev, 'abbreviation'),
-		'type':      (int,    '`meeting-type`'),
-		'parent':    (int,    'parent'),
-		'url':       (url,    'permanentURL'),
-		'desc':      (text,   'description'),
-		'tags':      (tags,   'tags'),
+		'name':      (str,     'name'),
+		'abbrev':    (abbrev,  'abbreviation'),
+		'type':      (int,     '`meeting-type`'),
+		'parent':    (int,     'parent'),
+		'url':       (url,     'permanentURL'),
+		'desc':      (unicode, 'description'),
+		'tags':      (tags,    'tags'),
 	}
 	conference_id = int(posted['id'])
 
@@ -302,13 +418,12 @@ def update_conference():
 
 	try:
 		db.update('Conferences', key = ('conference', conference_id),
-				values = new_value, credentials = auth.credentials)
+				values = new_value, credentials = auth.credentials())
 
 	except db.UnauthorizedAccessException, message:
 		return auth.authenticate(message)
 
-	abbrev_noquotes = new_value['abbreviation'][1:-1]
-	return flask.redirect('/edit/conference/%s' % abbrev_noquotes)
+	return flask.redirect('/edit/conference/%s' % new_value['abbreviation'])
 
 
 # Code to edit very simple tables (id -> text)
@@ -317,9 +432,9 @@ def edit_simple(table_name):
 	values = db.get(table_name)
 
 	headers = []
-	if len(values) > 0: headers = values[0].__dict__.keys()
+	if len(values) > 0: headers = values[0].field_names()
 
-	return flask.render_template('edit/simple.html',
+	return utils.render_template('edit/simple.html',
 			table = table_name,
 			headers = headers,
 			values = values,
@@ -339,12 +454,12 @@ def update_simple():
 		if key.startswith('table '): continue
 		if key == key_field: continue
 
-		new_value[key] = text(posted[key])
+		new_value[key] = posted[key]
 
 	try:
 		db.update(table_name,
 				key = (key_field, int(posted[key_field])),
-				values = new_value, credentials = auth.credentials)
+				values = new_value, credentials = auth.credentials())
 
 	except db.UnauthorizedAccessException, message:
 		return auth.authenticate(message)
@@ -364,7 +479,6 @@ def create_simple():
 
 		value = posted[key]
 		if value.startswith('http'): value = url(value)
-		else: value = text(posted[key])
 
 		if value == '': continue
 
@@ -372,7 +486,7 @@ def create_simple():
 		new_value[key] = value
 
 	try:
-		db.create(table_name, values = new_value, credentials = auth.credentials)
+		db.create(table_name, values = new_value, credentials = auth.credentials())
 
 	except db.UnauthorizedAccessException, message:
 		return auth.authenticate(message)
@@ -390,7 +504,7 @@ def edit_conferences():
 
 	tags = dict(db.get_tags())
 
-	return flask.render_template('edit/conferences.html',
+	return utils.render_template('edit/conferences.html',
 			table = 'Conferences',
 			tags = tags,
 			conferences = conferences,
@@ -406,12 +520,12 @@ def create_conference():
 
 	# POST form -> SQL mapping
 	fields = {
-		'name':      (text, 'name'),
-		'abbrev':    (text, 'abbreviation'),
-		'desc':      (text, 'description'),
-		'tags':      (tags, 'tags'),
-		'parent':    (int,  'parent'),
-		'url':       (url,  'url'),
+		'name':      (unicode, 'name'),
+		'abbrev':    (unicode, 'abbreviation'),
+		'desc':      (unicode, 'description'),
+		'tags':      (tags,    'tags'),
+		'parent':    (int,     'parent'),
+		'url':       (url,     'url'),
 	}
 
 	try:
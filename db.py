@@ -1,180 +1,803 @@
+import contextlib
 import datetime
+import hashlib
+import os
 import re
+import threading
+import time
+
+import metrics
+from backend import MySQL
+from pool import Pool
+from query import Batch, Select, Update, Insert
+from query import Tables, Fields, Values, Filter, Order
+
+
+# Where the data lives (see backend.py).
+backend = MySQL()
+
+# Where anonymous reads go (e.g. a MySQL replica or a backend.SQLite snapshot
+# of the data), if not to the primary 'backend'.
+replica = None
+
+# How far behind the primary the replica may be, in seconds: everyone reads
+# from the primary for this long after a write (see route).
+replica_lag = 60
+
+def configure(new_backend, new_replica = None, lag = 60):
+	""" Use a different backend (e.g. backend.SQLite) from now on. """
+	global backend, replica, replica_lag
+
+	# Connections to the old backends are closed as they're garbage collected.
+	with pools_lock:
+		(backend, replica, replica_lag) = (new_backend, new_replica, lag)
+		pools.clear()
+
+	with version_lock: version.update(number = None, checked = None)
+
+	# Nothing we've cached from the old backend is any good now.
+	for r in reference.values():
+		for table_name in r.tables: written(table_name, None)
+
+
+# Per-thread (i.e. per-request) routing: whether reads must see the primary
+# and when (if at all) this request wrote to it.
+routing = threading.local()
+
+def start_request(last_write = None):
+	"""
+	Route a new request's reads: to the primary if the client last wrote
+	(at 'last_write', in seconds since the epoch) too recently for the
+	replica to have caught up, else to the replica.
+	"""
+	routing.wrote = None
+	routing.primary = (
+		last_write is not None and time.time() - last_write < replica_lag)
+
+def last_write():
+	""" When the current request wrote to the database (None if it didn't). """
+	return getattr(routing, 'wrote', None)
+
+def wrote():
+	routing.wrote = time.time()
+	routing.primary = True
+
+def route(username = 'secconfdb', primary = False):
+	"""
+	The backend to use: credentialed and write cursors need the primary, as
+	do all reads for a while after a write (by any process). Otherwise, the
+	caches that a write clears would be refilled from a replica that may not
+	have the write yet, and keep its old data under the new data version.
+	"""
+	if replica is None or primary or username != 'secconfdb': return backend
+	if getattr(routing, 'primary', False): return backend
+	if recently_written(): return backend
+	return replica
+
+def recently_written():
+	""" Might the replica not have caught up with the latest write? """
+	(number, written) = current_version()
+	return time.time() - written < replica_lag
+
+
+def connect(source, database, username, password):
+	""" Open a new connection to the database. """
+	try: return source.connect(database, username, password)
+	except source.Error, e:
+		check_access(source, e)
+		raise
+
+def check_access(source, error):
+	""" Raise UnauthorizedAccessException if 'error' means access denied. """
+	message = source.denied(error)
+	if message is not None: raise UnauthorizedAccessException(message)
+
+
+def check_credentials(database, username, password):
+	"""
+	Check credentials with a new connection to the primary: a pooled
+	connection, once open, keeps working after its password has changed.
+	If they're refused, close any connections that were opened with them.
+	"""
+	try: connect(backend, database, username, password).close()
+	except UnauthorizedAccessException:
+		close_pools(database, username, password)
+		raise
+
+
+# Connection pools, keyed by backend and credentials (with a salted hash in
+# place of the password; the salt never leaves this process).
+pools = {}
+pools_lock = threading.Lock()
+salt = os.urandom(16)
+
+def password_hash(password):
+	if isinstance(password, unicode): password = password.encode('utf8')
+	return hashlib.sha256(salt + password).hexdigest()
+
+def pool_key(source, database, username, password):
+	return (source, database, username, password_hash(password))
+
+def pool(source, database, username, password):
+	key = pool_key(source, database, username, password)
+
+	with pools_lock:
+		if key not in pools:
+			pools[key] = Pool(
+				lambda: connect(source, database, username, password))
+
+		return pools[key]
+
+def close_pools(database, username, password):
+	""" Close every backend's pool of connections with some credentials. """
+	hashed = password_hash(password)
+
+	with pools_lock:
+		keys = [ k for k in pools if k[1:] == (database, username, hashed) ]
+		closing = [ pools.pop(k) for k in keys ]
+
+	for p in closing: p.close()
+
+def pool_stats():
+	"""
+	Pool statistics, summed by backend ('primary' or 'replica') and account
+	('anonymous' or 'editor') so that they don't name hosts or editors.
+	"""
+	with pools_lock: current = pools.items()
+
+	totals = {}
+	for ((source, database, username, password), p) in current:
+		key = ('primary' if source is backend else 'replica',
+			'anonymous' if username == 'secconfdb' else 'editor')
+
+		stats = p.stats()
+		if key not in totals:
+			totals[key] = stats
+			continue
+
+		for (name, value) in stats.items():
+			if name == 'max_wait': totals[key][name] = max(totals[key][name], value)
+			else: totals[key][name] += value
+
+	return totals
+
+
+@contextlib.contextmanager
+def cursor(database = 'secconfdb', username = 'secconfdb', password = '',
+		cursor_class = None, primary = False):
+	"""
+	Borrow a connection from the pool for the duration of a 'with'.
+
+	Anonymous cursors read from the replica (if any) unless 'primary' is set
+	or the current request has to read its own writes.
+	"""
+	source = route(username, primary)
+	p = pool(source, database, username, password)
+
+	start = metrics.start()
+	try: connection = p.acquire()
+	except UnauthorizedAccessException:
+		# Don't keep an (empty) pool around for every bad password we see.
+		key = pool_key(source, database, username, password)
+		with pools_lock:
+			if p.size == 0 and pools.get(key) is p: del pools[key]
+		raise
+
+	metrics.record('connect', start)
 
-import MySQLdb
+	try:
+		c = connection.cursor(cursor_class)
+		c.backend = source
+		yield c
 
-from query import Select, Update, Insert, Tables, Fields, Values, Filter, Order
+	finally: p.release(connection)
 
 
-def cursor(database = 'secconfdb', username = 'secconfdb', password = ''):
-	try:
-		connection = MySQLdb.connect(
-			host = 'localhost', db = database, user = username, passwd = password)
+def explain_connection(cursor):
+	"""
+	A new connection (not from a pool, which may have none free) to the
+	backend that a cursor is on, for metrics.plan().
+	"""
+	source = getattr(cursor, 'backend', None)
+	if source is None: return None
+	return connect(source, 'secconfdb', 'secconfdb', '')
 
-		connection.cursor().execute("""
-				SET NAMES utf8;
-				SET CHARACTER SET utf8;
-				SET character_set_connection=utf8;
-			""")
+metrics.explain_connection = explain_connection
 
-		return connection.cursor()
 
-	except MySQLdb.OperationalError, (errno, message):
-		if errno in (1044, 1045, 1142): raise UnauthorizedAccessException(message)
-		else: raise
+def execute(query, stream = False):
+	"""
+	Run a Select, returning a list of results or (if 'stream' is set) a
+	generator which yields results as they come off the wire.
+	"""
+	if stream: return stream_results(query)
+	with cursor() as c: return query.execute(c)
 
+def stream_results(query):
+	# An unbuffered cursor keeps the whole result set from sitting in memory.
+	with cursor(cursor_class = route().streaming_cursor) as c:
+		for result in query.iterate(c): yield result
 
-def get_tags(names = None, ids = None):
-	where = Filter(None)
-	if names is not None:
-		where = Filter("name in ('%s')" % "','".join(names))
+
+def get_tags(names = None, ids = None, conference = None):
+	""" (id, name) pairs for some (or all) tags, ordered by name. """
+	if conference is not None:
+		query = Select(
+				fields = Fields([ 'tag', 'name' ]),
+				source = Tables('Tags INNER JOIN ConferenceTags USING (tag)'),
+				filter = Filter.equals('conference', conference),
+				order = Order('name'))
+
+		with cursor() as c: results = query.execute(c)
+		return [ (i.tag, i.name) for i in results ]
+
+	(tags, ids_by_name, names_by_id) = reference['tags'].get()
 
 	if type(ids) == str:
-		ids = [ str(int(x)) for x in ids.split(',') ]
+		ids = [ int(x) for x in ids.split(',') ]
 
 	if ids is not None:
-		where = Filter("tag in (%s)" % ','.join(ids))
+		return sorted([
+			(int(id), names_by_id[int(id)])
+				for id in set(ids) if int(id) in names_by_id
+		], key = lambda tag: tag[1])
 
+	if names is not None:
+		return sorted([
+			(ids_by_name[name], name)
+				for name in set(names) if name in ids_by_name
+		], key = lambda tag: tag[1])
+
+	return list(tags)
+
+def load_tags():
 	query = Select(
 			fields = Fields([ 'tag', 'name' ]),
 			source = Tables('Tags'),
-			filter = where,
+			filter = Filter(None),
 			order = Order('name'))
 
-	results = query.execute(cursor())
+	with cursor() as c: tags = [ (i.tag, i.name) for i in query.execute(c) ]
 
-	return [ (i.tag, i.name) for i in results ]
+	return (
+		tags,
+		dict([ (name, id) for (id, name) in tags ]),
+		dict(tags),
+	)
 
 
-def deadlines(tags = []):
+def deadlines(tags = [], stream = False):
+	"""
+	Upcoming deadlines, in the order given by Order.deadline().
+
+	Finding them is a range scan over the (indexed) deadline columns; the
+	database then sorts just those, so that they can be streamed.
+	"""
 	query = Select(
 			filter = Filter.upcomingDeadlines() & Filter.tags(tags),
 			order = Order.deadline())
-	return query.execute(cursor())
+	return execute(query, stream)
 
-def upcoming(tags = []):
+def upcoming(tags = [], stream = False):
 	query = Select(
 			filter = Filter.upcoming() & Filter.tags(tags),
 			order = Order.start_date())
-	return query.execute(cursor())
+	return execute(query, stream)
 
-def recent(tags = []):
+def recent(tags = [], stream = False):
 	query = Select(
 			filter = Filter.recent() & Filter.tags(tags),
 			order = Order.start_date(reverse = True))
-	return query.execute(cursor())
+	return execute(query, stream)
+
+def front_page(tags = []):
+	"""
+	Fetch everything on the front page (upcoming deadlines, upcoming
+	conferences and recent conferences) with one query, returning the
+	same three lists as deadlines(), upcoming() and recent().
+	"""
+	query = Select(
+			filter = (
+				Filter.upcomingDeadlines() | Filter.by_date(-180, 365)
+			) & Filter.tags(tags),
+			order = Order.start_date())
+
+	with cursor() as c: events = query.execute(c)
+
+	today = datetime.date.today()
+	def days_away(date): return (date - today).days
+
+	return (
+		sorted(
+			[ e for e in events if _deadline_upcoming(e, today) ],
+			key = lambda e: _deadline_order(e, today)),
+		[ e for e in events if 0 <= days_away(e.startDate) <= 365 ],
+		[ e for e in reversed(events) if -180 <= days_away(e.startDate) <= 0 ],
+	)
+
+def _effective_deadline(event):
+	""" Python version of ConferenceInstances.effectiveDeadline. """
+	if event.extendedDeadline is None: return event.deadline
+	else: return event.extendedDeadline
+
+def _deadline_upcoming(event, today):
+	""" Python version of Filter.upcomingDeadlines(). """
+	cutoff = today - datetime.timedelta(14)
+	return any([
+		date is not None and date >= cutoff for date in
+			(_effective_deadline(event), event.posterDeadline)
+	])
+
+def _deadline_order(event, today):
+	""" Python version of Order.deadline() (NULLs first, as in MySQL). """
+	cutoff = today - datetime.timedelta(14)
+
+	date = _effective_deadline(event)
+	if date is not None and date < cutoff: date = event.posterDeadline
+
+	return (date is not None, date)
 
 def locations():
-	return Select(
-			source = Tables.locations(),
-			fields = Fields.locations(),
-			filter = Filter(None),
-			order = Order.locations()
-		).execute(cursor())
+	return list(reference['locations'].get())
+
+def load_locations():
+	with cursor() as c:
+		return Select(
+				source = Tables.locations(),
+				fields = Fields.locations(),
+				filter = Filter(None),
+				order = Order.locations()
+			).execute(c)
 
 def meeting_types():
-	return Select(
-			source = Tables('MeetingTypes'),
-			fields = Fields.meeting_types(),
-			filter = Filter(None),
-			order  = Order(None),
-		).execute(cursor())
+	return list(reference['meeting types'].get())
+
+def load_meeting_types():
+	with cursor() as c:
+		return Select(
+				source = Tables('MeetingTypes'),
+				fields = Fields.meeting_types(),
+				filter = Filter(None),
+				order  = Order(None),
+			).execute(c)
 
 def most_recent():
-	return Select(
-			fields = Fields.events(),
-			source = Tables.events(),
-			filter = Filter("""
-	startDate = (
-		select max(startDate) from ConferenceInstances AS ci
-			where ci.conference = ConferenceInstances.conference)
-	"""),
-			order = Order("startDate"),
-		).execute(cursor())
+	with cursor() as c:
+		return Select(
+				fields = Fields.events(),
+				source = Tables.events(),
+				filter = Filter.latest(),
+				order = Order("startDate"),
+			).execute(c)
 
 def conferences():
-	return Select(
-			fields = Fields.conference(),
-			source = Tables.conference(),
-			filter = Filter(None),
-			order = Order("abbreviation"),
-		).execute(cursor())
+	return list(reference['conferences'].get())
+
+def load_conferences():
+	with cursor() as c:
+		return Select(
+				fields = Fields.conference(),
+				source = Tables.conference(),
+				filter = Filter(None),
+				order = Order("abbreviation"),
+			).execute(c)
 
 def conference(id = None, abbreviation = None):
 	assert (id is not None) ^ (abbreviation is not None)
 
 	filter = None
-	if id is not None: filter = Filter("conference = %d" % id)
-	else: filter = Filter("abbreviation = '%s'" % abbreviation)
-
-	c = cursor()
+	if id is not None: filter = Filter.equals('conference', id)
+	else: filter = Filter.equals('abbreviation', abbreviation)
 
-	conferences = Select(
-			fields = Fields.conference(),
-			source = Tables.conference(),
-			filter = filter,
-			order = Order(None),
-		).execute(c)
+	with cursor() as c:
+		conferences = Select(
+				fields = Fields.conference(),
+				source = Tables.conference(),
+				filter = filter,
+				order = Order(None),
+			).execute(c)
 
 	if len(conferences) == 0: return None
-	else: return conferences[0].__dict__
+	else: return conferences[0].as_dict()
+
+
+def instance_conference(instance):
+	""" The ID of the conference that an instance is of (or None). """
+	rows = execute(Select(
+		fields = Fields([ 'conference' ]),
+		source = Tables('ConferenceInstances'),
+		filter = Filter.equals('instance', instance),
+		order = Order(None)))
+
+	return rows[0].conference if len(rows) > 0 else None
 
 
 def conference_events(id = None, abbreviation = None):
-	conf = conference(id, abbreviation)
-	if conf['parent']:
-		conf['parent'] = conference(id = int(conf['parent']))
+	"""
+	Fetch a conference (with its parent conference and the names of its
+	tags) and all of its instances in a single round trip.
+	"""
+	assert (id is not None) ^ (abbreviation is not None)
+
+	if id is not None: key = ('conference', id)
+	else: key = ('abbreviation', abbreviation)
+
+	conference_query = Select(
+			fields = Fields.conference_page(),
+			source = Tables.conference_page(),
+			filter = Filter.equals('Conferences.%s' % key[0], key[1]),
+			order = Order(None))
+
+	events_query = Select(
+			filter = Filter.equals(*key),
+			order = Order.start_date(reverse = True))
 
-	if conf['tags'] and len(conf['tags']) > 0:
-		conf['tags'] = [
-			name for (id, name) in get_tags(ids = conf['tags'].split(',')) ]
-	else:
-		conf['tags'] = []
+	with cursor() as c:
+		(conferences, events) = Batch(conference_query, events_query).execute(c)
 
-	events = Select(
-			filter = Filter('conference = %d' % conf['conference']),
-			order = Order.start_date(reverse = True),
-		).execute(cursor())
+	if len(conferences) == 0: return (None, [])
+	row = conferences[0].as_dict()
+
+	names = Fields.conference().names()
+	conf = dict([ (name, row[name]) for name in names ])
+
+	if conf['parent']:
+		conf['parent'] = None
+		if row['parent_conference'] is not None:
+			conf['parent'] = dict([
+				(name, row['parent_' + name]) for name in names ])
+
+	if row['tag_names']: conf['tags'] = sorted(row['tag_names'].split(','))
+	else: conf['tags'] = []
 
 	return (conf, events)
 
 
+# Functions to call after a write has been committed.
+write_hooks = []
+
+def on_write(hook):
+	"""
+	Decorator: call hook(table_name, key) after every committed write,
+	where 'key' is the ID of the row that was updated or created.
+	"""
+	write_hooks.append(hook)
+	return hook
+
+def written(table_name, key):
+	for hook in write_hooks: hook(table_name, key)
+
+
+# What version of the data are we serving? Every write bumps the number in the
+# DataVersion table as part of its transaction, so every process (including
+# bulk_import.py) agrees on it; we re-read it at most every 'version_ttl'
+# seconds. Everything we show is relative to CURDATE(), so the data also
+# change at midnight.
+version = { 'number': None, 'written': 0, 'checked': None }
+version_lock = threading.Lock()
+version_ttl = 5
+
+def store_version(cursor):
+	""" Bump the shared data version (within a write's transaction). """
+	cursor.execute('UPDATE DataVersion SET version = version + 1, written = %s',
+		(int(time.time()),))
+
+	cursor.execute('SELECT version, written FROM DataVersion')
+	return cursor.fetchone()
+
+def seen_version(number, written):
+	""" Note the latest version that we know of (e.g. after writing it). """
+	with version_lock:
+		if version['number'] is None or number >= version['number']:
+			version.update(number = number, written = written)
+
+		version['checked'] = time.time()
+		return (version['number'], version['written'])
+
+def current_version():
+	"""
+	The shared data version: a (number, last written) pair, where 'last
+	written' is in seconds since the epoch.
+	"""
+	with version_lock:
+		checked = version['checked']
+		if checked is not None and time.time() - checked < version_ttl:
+			return (version['number'], version['written'])
+
+	with cursor(primary = True) as c:
+		c.execute('SELECT version, written FROM DataVersion')
+		(number, written) = c.fetchone()
+
+	return seen_version(number, written)
+
+def data_version():
+	"""
+	Return a (stamp, last modified) pair, where the stamp is a string that
+	changes whenever the content of any page might have changed and 'last
+	modified' is when that last happened (in seconds since the epoch).
+	"""
+	today = datetime.date.today()
+	midnight = time.mktime(today.timetuple())
+
+	(number, written) = current_version()
+	return ('%d.%s' % (number, today.isoformat()), max(written, midnight))
+
+
+class ReferenceTable:
+	"""
+	A small table that rarely changes (e.g. tags), loaded once per process
+	and reloaded (when next used) after a write to any of the tables it is
+	derived from, once the shared data version changes (i.e. after a write
+	by another process) or when the data reach 'max_age' seconds old.
+	"""
+
+	def __init__(self, load, tables, max_age = 600):
+		self.load = load
+		self.tables = tables
+		self.max_age = max_age
+
+		self.lock = threading.Lock()
+		self.data = None
+		self.loaded = None
+		self.version = None
+		self.generation = 0
+
+		on_write(self.written)
+
+	def get(self):
+		(number, written) = current_version()
+
+		with self.lock:
+			if (self.data is not None and self.version == number
+					and time.time() - self.loaded < self.max_age):
+				return self.data
+
+			generation = self.generation
+
+		data = self.load()
+
+		with self.lock:
+			# Don't keep data that may have been read before a write.
+			if generation == self.generation:
+				(self.data, self.loaded, self.version) = (
+					data, time.time(), number)
+
+		return data
+
+	def written(self, table_name, key):
+		if table_name not in self.tables: return
+
+		with self.lock:
+			self.data = None
+			self.generation += 1
+
+
+reference = {
+	'tags': ReferenceTable(load_tags, [ 'Tags' ]),
+	'meeting types': ReferenceTable(load_meeting_types, [ 'MeetingTypes' ]),
+	'locations': ReferenceTable(load_locations,
+		[ 'Locations', 'Regions', 'Countries' ]),
+	'conferences': ReferenceTable(load_conferences, [ 'Conferences' ]),
+}
+
+
 class UnauthorizedAccessException(Exception):
 	def __init__(*args):
 		Exception.__init__(*args)
 
 
+def store_tags(cursor, conference, tags):
+	"""
+	Record a conference's tags (a comma-separated list of tag IDs, as stored
+	in Conferences.tags) in the ConferenceTags membership table.
+	"""
+	cursor.execute(
+		'DELETE FROM ConferenceTags WHERE conference = %s', (conference,))
+
+	if tags is None or len(tags) == 0: return
+
+	ids = sorted(set([ int(tag) for tag in tags.split(',') ]))
+	cursor.execute(
+		'INSERT INTO ConferenceTags (conference, tag) VALUES %s'
+			% ','.join([ '(%s,%s)' ] * len(ids)),
+		sum([ (conference, tag) for tag in ids ], ()))
+
+
+def store_effective_deadline(cursor, instance):
+	""" Keep ConferenceInstances.effectiveDeadline in step with the deadlines. """
+	cursor.execute("""
+		UPDATE ConferenceInstances
+			SET effectiveDeadline = COALESCE(extendedDeadline, deadline)
+			WHERE instance = %s
+		""", (instance,))
+
+
+# Set Conferences.latestInstance (for the conferences in a WHERE clause).
+latest_instance = """
+	UPDATE Conferences SET latestInstance = (
+		SELECT instance FROM ConferenceInstances AS ci
+			WHERE ci.conference = Conferences.conference
+			ORDER BY startDate DESC, instance DESC
+			LIMIT 1)
+	"""
+
+def store_latest_instance(cursor, instance):
+	"""
+	Point an instance's conference at its most recent instance (which may
+	or may not be this one) via Conferences.latestInstance.
+	"""
+	cursor.execute(latest_instance + """
+		WHERE conference = (
+			SELECT conference FROM ConferenceInstances WHERE instance = %s)
+		""", (instance,))
+
+def instance_owner(cursor, instance):
+	""" The conference that an instance is of, as seen by a transaction. """
+	cursor.execute(
+		'SELECT conference FROM ConferenceInstances WHERE instance = %s',
+		(instance,))
+
+	row = cursor.fetchone()
+	return row[0] if row else None
+
+def store_latest_instances(cursor, conferences):
+	""" Update Conferences.latestInstance for several conferences at once. """
+	cursor.execute(latest_instance + """
+		WHERE conference IN (%s)""" % ','.join([ '%s' ] * len(conferences)),
+		tuple(conferences))
+
+
 def update(table_name, key, values, credentials):
+	tags = values.get('tags')
+
 	query = Update(
 			table = Tables(table_name, use_from = False),
 			values = Values('SET', values),
-			filter = Filter("%s = %d" % key)
+			filter = Filter.equals(*key)
 		)
 
-	try: query.execute(cursor(**credentials))
-	except MySQLdb.OperationalError, (errno, text):
-		if errno == 1142: raise UnauthorizedAccessException(text)
-		else: raise
+	try:
+		with cursor(primary = True, **credentials) as c:
+			# An instance moving to another conference changes the latest
+			# instance of the one it leaves, too.
+			previous = None
+			if table_name == 'ConferenceInstances' and 'conference' in values:
+				previous = instance_owner(c, key[1])
+
+			query.execute(c, commit = False)
+
+			if table_name == 'Conferences' and 'tags' in values:
+				store_tags(c, key[1], tags)
+
+			if table_name == 'ConferenceInstances':
+				store_effective_deadline(c, key[1])
+				store_latest_instance(c, key[1])
+				if previous is not None: store_latest_instances(c, [ previous ])
+
+			new_version = store_version(c)
+			c.connection.commit()
+
+	except backend.Error, e:
+		check_access(backend, e)
+		raise
+
+	seen_version(*new_version)
+	wrote()
+	written(table_name, key[1])
 
 
 def create(table_name, values, credentials):
+	tags = values.get('tags')
+
 	query = Insert(
 			table = Tables(table_name, use_from = False),
 			fields = Fields(values.keys()),
 			values = Values('VALUES', values),
 		)
 
-	try: query.execute(cursor(**credentials))
-	except MySQLdb.OperationalError, (errno, text):
-		if errno == 1142: raise UnauthorizedAccessException(text)
-		else: raise
+	try:
+		with cursor(primary = True, **credentials) as c:
+			id = query.execute(c, commit = False)
+
+			if table_name == 'Conferences' and 'tags' in values:
+				store_tags(c, id, tags)
+
+			if table_name == 'ConferenceInstances':
+				store_effective_deadline(c, id)
+				store_latest_instance(c, id)
+
+			new_version = store_version(c)
+			c.connection.commit()
+
+	except backend.Error, e:
+		check_access(backend, e)
+		raise
+
+	seen_version(*new_version)
+	wrote()
+	written(table_name, id)
+
+
+def create_many(cursor, table_name, rows):
+	"""
+	Insert rows (dictionaries with the same keys) without committing, in as
+	few statements as will fit in MySQL packets.
+	"""
+	if len(rows) == 0: return
+
+	names = rows[0].keys()
+	for query in Insert.rows(
+			table = Tables(table_name, use_from = False),
+			fields = Fields(names),
+			rows = [ [ row[name] for name in names ] for row in rows ]):
+		query.execute(cursor, commit = False)
+
+
+def bulk_create(conferences, instances, credentials):
+	"""
+	Create many conferences and instances in one transaction: all of them
+	or (if anything goes wrong) none of them.
+
+	Both are lists of dictionaries of field values, except that an instance's
+	'conference' is an abbreviation (of a new or existing conference) and a
+	conference's 'tags' are a comma-separated list of tag IDs.
+	"""
+	try:
+		with cursor(primary = True, **credentials) as c:
+			create_many(c, 'Conferences', conferences)
+
+			# Look up the (new and existing) conferences' IDs.
+			abbreviations = list(set(
+				[ conf['abbreviation'] for conf in conferences ]
+				+ [ i['conference'] for i in instances ]))
+
+			ids = dict([ (conf.abbreviation, conf.conference) for conf in Select(
+					fields = Fields([ 'conference', 'abbreviation' ]),
+					source = Tables.conference(),
+					filter = Filter.one_of('abbreviation', abbreviations),
+					order = Order(None),
+				).execute(c) ])
+
+			for abbreviation in abbreviations:
+				if abbreviation not in ids:
+					raise ValueError, "No such conference: '%s'" % abbreviation
+
+			create_many(c, 'ConferenceTags', [
+				{ 'conference': ids[conf['abbreviation']], 'tag': int(tag) }
+					for conf in conferences if conf.get('tags')
+					for tag in set(conf['tags'].split(','))
+			])
+
+			instances = [ dict(i,
+					conference = ids[i['conference']],
+					effectiveDeadline = i.get('extendedDeadline') or i.get('deadline'))
+				for i in instances ]
+
+			create_many(c, 'ConferenceInstances', instances)
+
+			if len(instances) > 0:
+				store_latest_instances(c,
+					list(set([ i['conference'] for i in instances ])))
+
+			new_version = store_version(c)
+			c.connection.commit()
+
+	except backend.Error, e:
+		check_access(backend, e)
+		raise
+
+	seen_version(*new_version)
+	wrote()
+	if len(conferences) > 0: written('Conferences', None)
+	if len(instances) > 0: written('ConferenceInstances', None)
 
 
 def get(table_name):
-	return Select(
-			source = Tables(table_name),
-			fields = Fields('*'),
-			filter = Filter(None),
-			order = Order(None),
-		).execute(cursor())
+	with cursor() as c:
+		return Select(
+				source = Tables(table_name),
+				fields = Fields('*'),
+				filter = Filter(None),
+				order = Order(None),
+			).execute(c)
 
@@ -1,52 +1,92 @@
+import keyword
 import re
+import threading
 
-class Event:
-	def __init__(self, data):
-		assert data is not None
-		assert len(data) > 0
 
-		self.__dict__.update(data)
+def memoized(method):
+	"""
+	Decorator for display methods: compute the value once per row (and set
+	of arguments), then reuse it. The original is kept as 'uncached'.
+	"""
+	name = method.__name__
+
+	def wrapper(self, *args):
+		key = (name, args) if args else name
+
+		memo = getattr(self, '_memo', None)
+		if memo is None: memo = self._memo = {}
+		elif key in memo: return memo[key]
+
+		value = memo[key] = method(self, *args)
+		return value
+
+	wrapper.__name__ = name
+	wrapper.__doc__ = method.__doc__
+	wrapper.uncached = method
+	return wrapper
+
+
+months = [ None,
+	'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+	'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec',
+]
+
+def format_date(date, year = True):
+	""" The same as date.strftime("%d %b %Y").lstrip("0"), but faster. """
+	if year: return '%d %s %d' % (date.day, months[date.month], date.year)
+	else: return '%d %s' % (date.day, months[date.month])
+
+
+class Row(object):
+	""" Methods common to all rows, however their fields are stored. """
+
+	__slots__ = ()
 
+	# Field names, in query order (None if they're just whatever is in __dict__).
+	_fields = None
 
+
+	@memoized
 	def when(self):
 		""" Pretty-printed date (e.g. 27 Feb-2 Mar 2012). """
 
-		if not self.__dict__.has_key('startDate'): return None
+		if not hasattr(self, 'startDate'): return None
 
 		start = self.startDate
 		end = self.endDate
 
 		s = None
 
-		if start.year != end.year: s = start.strftime("%d %b %Y").lstrip("0")
-		elif start.month != end.month: s = start.strftime("%d %b").lstrip("0")
+		if start.year != end.year: s = format_date(start)
+		elif start.month != end.month: s = format_date(start, year = False)
 		elif start.day != end.day: s = str(start.day)
 
 		if s is None: s = ""
 		else: s += "-"
 
-		s += end.strftime("%d %b %Y").lstrip("0")
+		s += format_date(end)
 		return s
 
 
+	@memoized
 	def where(self):
 		location = (self.location, self.region, self.country)
 		return ", ".join(
 			[ unicode(i, "utf8") for i in location if i is not None ])
 
 
+	@memoized
 	def format_deadline(self, which = None):
 		date = None
 		if which is None: date = self.deadline
-		else: date = self.__dict__[which + "Deadline"]
+		else: date = getattr(self, which + "Deadline")
 
 		if date is None: return ""
-		return date.strftime("%d %b %Y").lstrip("0")
+		return format_date(date)
 
 
 	def tag_names(self, all_tags):
-		if 'tags' not in self.__dict__: return []
-		if self.tags is None: return []
+		if getattr(self, 'tags', None) is None: return []
 
 		my_tags = [ int(i) for i in self.tags.split(',') ]
 		return ', '.join([ all_tags[i] for i in my_tags ])
@@ -60,10 +100,76 @@ class Event:
 			re.sub("^[a-z]+://", "", self.proceedings))
 
 
+	def field_names(self):
+		if self._fields is not None: return list(self._fields)
+		return [ name for name in self.__dict__ if not name.startswith('_') ]
+
+	def as_dict(self):
+		return dict([ (name, getattr(self, name)) for name in self.field_names() ])
+
 
 	def __str__(self):
 		return "%s: %s in %s" % (self.abbreviation, self.when(), self.where())
-		
+
 	def __repr__(self):
-		return repr(self.__dict__)
+		return repr(self.as_dict())
+
+
+class Event(Row):
+	""" A row whose fields come from a dictionary. """
+
+	def __init__(self, data):
+		assert data is not None
+		assert len(data) > 0
+
+		self.__dict__.update(data)
+
 
+# Row classes, keyed by field names.
+row_classes = {}
+row_classes_lock = threading.Lock()
+
+def row_class(names):
+	"""
+	A class for rows with the given fields, to be constructed from their
+	values (in order) as positional arguments.
+
+	Where the names allow it, the class stores its fields in __slots__
+	rather than a per-row dictionary.
+	"""
+	names = tuple(names)
+
+	with row_classes_lock:
+		if names not in row_classes:
+			row_classes[names] = make_row_class(names)
+
+		return row_classes[names]
+
+def make_row_class(names):
+	# Names like 'meeting-type' (from SELECT *) can't be slots or arguments.
+	valid = re.compile('[A-Za-z][A-Za-z0-9_]*$')
+	if (len(set(names)) < len(names) or [ n for n in names
+			if not valid.match(n) or keyword.iskeyword(n) ]):
+		def __init__(self, *values):
+			self.__dict__.update(zip(names, values))
+
+		return type('Row', (Row,), { '_fields': names, '__init__': __init__ })
+
+	# Positional arguments (no zip, no dict) make construction as cheap
+	# as it can be.
+	arguments = [ '_%d' % i for i in range(len(names)) ]
+	source = 'def __init__(self, %s):\n%s' % (
+		', '.join(arguments),
+		''.join([
+			'\tself.%s = %s\n' % (name, argument)
+				for (name, argument) in zip(names, arguments)
+		]))
+
+	namespace = {}
+	exec source in namespace
+
+	return type('Row', (Row,), {
+		'__slots__': names + ('_memo',),
+		'_fields': names,
+		'__init__': namespace['__init__'],
+	})
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+"""
+Export the site as static files (and gzipped copies) that nginx can serve.
+
+Usage: export.py [--output DIR] [--conference ABBREVIATION ...]
+                 [--instance ID ...]
+
+With no --conference or --instance options, every page is rendered:
+the front page (for the default tags, no tags and each single tag), each
+conference's page and feed, /most_recent and the calendar feeds. Otherwise,
+only the pages that a write to those conferences or instances can affect
+are re-rendered. Files whose content hasn't changed are left alone.
+
+Front pages depend on the 'tags' cookie, so they are written to
+front/<tags>.html (front/.html for no tags) as well as index.html (for the
+default tags). For example, with the application itself at @app:
+
+	map $http_cookie $front_page {
+		~(^|;\s*)tags="?(?<tags>[^;"]*) /front/$tags.html;
+		default /index.html;
+	}
+
+	location = / {
+		gzip_static on;
+		try_files $front_page @app;
+	}
+
+	location / {
+		gzip_static on;
+		try_files $uri $uri.html @app;
+	}
+"""
+
+import gzip
+import optparse
+import os
+import sys
+import time
+
+import confdb
+import db
+import utils
+
+
+def front_pages():
+	""" (path, tag names) for each front page that we export. """
+	tag_sets = [ sorted(utils.default_tags), [] ]
+	tag_sets += [ [ name ] for (id, name) in db.get_tags() ]
+
+	return [ ('/front/%s.html' % ','.join(tags), tags) for tags in tag_sets ]
+
+
+def tag_feeds(tag_sets):
+	return sum([
+		[ '/feeds/%s/conferences.ics' % ','.join(tags),
+		  '/feeds/%s/deadlines.ics' % ','.join(tags) ]
+			for tags in tag_sets if len(tags) > 0
+	], [])
+
+
+def conference_pages(abbreviation):
+	return [
+		('/conference/%s' % abbreviation, '/conference/%s.html' % abbreviation),
+		('/feeds/conference/%s.ics' % abbreviation, None),
+	]
+
+
+def everything():
+	""" (URL, file) pairs for every page, where file None means the URL. """
+	fronts = front_pages()
+
+	pages = [ ('/', '/index.html'), ('/most_recent', '/most_recent.html') ]
+	pages += [ ('/', path) for (path, tags) in fronts ]
+	pages += [ (url, None) for url in
+		[ '/conferences.ics', '/deadlines.ics' ]
+			+ tag_feeds([ tags for (path, tags) in fronts ]) ]
+
+	for conference in db.conferences():
+		pages += conference_pages(conference.abbreviation)
+
+	return pages
+
+
+def affected(conferences = [], instances = []):
+	"""
+	(URL, file) pairs for the pages that writes to some conferences (by
+	abbreviation) or instances (by ID) can change.
+	"""
+	all_conferences = db.conferences()
+	by_id = dict([ (c.conference, c) for c in all_conferences ])
+	by_abbreviation = dict([ (c.abbreviation, c) for c in all_conferences ])
+
+	ids = set([ by_abbreviation[a].conference for a in conferences ])
+	ids.update([ db.instance_conference(i) for i in instances ])
+	ids.discard(None)
+
+	# Child conferences' pages show their parents' names.
+	ids.update([ c.conference for c in all_conferences if c.parent in ids ])
+
+	tag_names = dict(db.get_tags())
+	fronts = front_pages()
+
+	pages = [ ('/', '/index.html'), ('/most_recent', '/most_recent.html') ]
+	pages += [ ('/', path) for (path, tags) in fronts ]
+	pages += [ ('/conferences.ics', None), ('/deadlines.ics', None) ]
+
+	for id in ids:
+		conference = by_id[id]
+		pages += conference_pages(conference.abbreviation)
+
+		# Feeds for the tag sets that include this conference.
+		tags = set([ tag_names.get(int(t)) for t in
+			(conference.tags or '').split(',') if t ])
+
+		pages += [ (url, None) for url in tag_feeds([ t for (p, t) in fronts
+			if len(tags.intersection(t)) > 0 ]) ]
+
+	return sorted(set(pages))
+
+
+def export(pages, output):
+	""" Render pages and write any that have changed; returns the count. """
+	client = confdb.app.test_client()
+	fronts = dict(front_pages())
+	changed = 0
+
+	for (url, path) in pages:
+		path = path or url
+
+		headers = {}
+		if path in fronts: headers['Cookie'] = 'tags=%s' % ','.join(fronts[path])
+
+		response = client.get(url, headers = headers)
+		filename = os.path.join(output, path.lstrip('/'))
+
+		if response.status_code == 404:
+			remove(filename)
+			continue
+
+		if response.status_code != 200:
+			raise IOError, '%s: %s' % (url, response.status)
+
+		if write(filename, response.data): changed += 1
+
+	return changed
+
+
+def write(filename, data):
+	""" Atomically write a file and its .gz, unless they're up to date. """
+	if os.path.exists(filename) and open(filename).read() == data: return False
+
+	directory = os.path.dirname(filename)
+	if not os.path.isdir(directory): os.makedirs(directory)
+
+	open(filename + '.tmp', 'w').write(data)
+
+	compressed = gzip.GzipFile(filename + '.gz.tmp', 'wb', 9, mtime = 0)
+	compressed.write(data)
+	compressed.close()
+
+	os.rename(filename + '.gz.tmp', filename + '.gz')
+	os.rename(filename + '.tmp', filename)
+	return True
+
+
+def remove(filename):
+	for name in (filename, filename + '.gz'):
+		if os.path.exists(name): os.remove(name)
+
+
+if __name__ == '__main__':
+	parser = optparse.OptionParser()
+	parser.add_option('--output', default = 'static-export',
+		help = 'directory to write the site to')
+	parser.add_option('--conference', action = 'append', default = [],
+		help = 'only re-export pages affected by this conference')
+	parser.add_option('--instance', action = 'append', type = 'int',
+		default = [], help = 'only re-export pages affected by this instance')
+
+	(options, args) = parser.parse_args()
+
+	start = time.time()
+
+	if options.conference or options.instance:
+		try: pages = affected(options.conference, options.instance)
+		except KeyError, e:
+			print >> sys.stderr, 'No such conference: %s' % e
+			sys.exit(1)
+	else:
+		pages = everything()
+
+	changed = export(pages, options.output)
+	print 'Rendered %d pages (%d changed) in %.2f s' % (
+		len(pages), changed, time.time() - start)
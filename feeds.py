@@ -0,0 +1,109 @@
+"""
+Serialized iCalendar feeds, generated once per version of the data.
+
+Feeds are keyed by what they contain (e.g. the upcoming conferences with a
+particular set of tags) as well as db.data_version(), so they are rebuilt
+after a write (by any process, as the version is kept in the database) or
+when the date rolls over and are otherwise served from memory.
+"""
+
+import cache
+import db
+import vcal
+
+
+def dates(events):
+	""" vCal events for the dates of some conference instances. """
+	for event in events:
+		yield (
+			event.abbreviation, event.name, event.where(),
+			(event.startDate, event.endDate)
+		)
+
+def deadlines(conferences):
+	""" vCal events for the deadlines of some conference instances. """
+	for conf in conferences:
+		# Use extended paper deadline if it exists, or the original otherwise.
+		if conf.extendedDeadline:
+			yield (
+				"%s Deadline (extended)" % conf.abbreviation,
+				"Extended paper deadline for %s" % conf.name,
+				conf.where(),
+				conf.extendedDeadline,
+			)
+		elif conf.deadline:
+			yield (
+				"%s Deadline" % conf.abbreviation,
+				"Paper deadline for %s" % conf.name,
+				conf.where(),
+				conf.deadline,
+			)
+
+		# A conference may also have a poster deadline.
+		if conf.posterDeadline:
+			yield (
+				"%s Poster Deadline" % conf.abbreviation,
+				"Poster deadline for %s" % conf.name,
+				conf.where(),
+				conf.posterDeadline,
+			)
+
+
+class FeedStore:
+	""" A bounded store of serialized feeds. """
+
+	def __init__(self, max_size = 256):
+		self.feeds = cache.LRU(max_size)
+
+		# Feeds for old versions are never used again: free them early.
+		db.on_write(self.feeds.clear)
+
+	def get(self, key, title, events):
+		"""
+		Get the serialized feed for 'key', calling 'events' to generate its
+		events if it isn't in the store (or the data have changed).
+		"""
+		(version, modified) = db.data_version()
+		key = (key, version)
+
+		body = self.feeds.get(key)
+		if body is None:
+			generation = self.feeds.generation
+			body = ''.join(vcal.calendar(events(), title, modified))
+			self.feeds.put(key, body, generation)
+
+		return body
+
+	def conferences(self, tag_names):
+		""" Upcoming conferences with any of the given tags. """
+		tag_names = tuple(sorted(tag_names))
+		return self.get(('conferences', tag_names),
+			'Upcoming Conferences (%s)' % ', '.join(tag_names),
+			lambda: dates(db.upcoming(tag_ids(tag_names))))
+
+	def deadlines(self, tag_names):
+		""" Upcoming deadlines for conferences with any of the given tags. """
+		tag_names = tuple(sorted(tag_names))
+		return self.get(('deadlines', tag_names),
+			'Conference Deadlines (%s)' % ', '.join(tag_names),
+			lambda: deadlines(db.deadlines(tag_ids(tag_names))))
+
+	def conference(self, abbreviation):
+		"""
+		Dates and deadlines of every instance of a conference
+		(raises KeyError if there is no such conference).
+		"""
+		def events():
+			(conf, instances) = db.conference_events(abbreviation = abbreviation)
+			if conf is None: raise KeyError(abbreviation)
+
+			for event in dates(instances): yield event
+			for event in deadlines(instances): yield event
+
+		return self.get(('conference', abbreviation),
+			abbreviation, events)
+
+
+def tag_ids(names):
+	# With no matching tags, match nothing (rather than everything).
+	return [ id for (id, name) in db.get_tags(names) ] or [ 0 ]
@@ -0,0 +1,328 @@
+"""
+Where requests spend their time: per-request phase timings (for a
+Server-Timing header), histograms of them (for /metrics) and a log of slow
+queries.
+
+Instrumented code brackets each phase with start() and record():
+
+	start = metrics.start()
+	cursor.execute(sql, params)
+	metrics.record('query', start, sql = sql)
+
+When instrumentation and the slow query log are disabled (the default),
+start() returns None and record() returns immediately, so the cost is two
+function calls.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+
+enabled = False
+
+# Statements that take at least this many seconds (if it's set) are logged,
+# with their query plans, to 'slow_log'.
+slow_threshold = None
+slow_log = logging.getLogger('secconfdb.slow_queries')
+
+# Opens a connection of its own to the backend that a cursor is on, to EXPLAIN
+# slow statements with: theirs may still have results to send (set by db).
+explain_connection = None
+
+# The phases we time, in the order they're reported.
+phases = [ 'connect', 'query', 'fetch', 'rows', 'render' ]
+
+# Histogram bucket boundaries, in seconds.
+buckets = [ .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10 ]
+
+
+def start():
+	if enabled or slow_threshold is not None: return time.time()
+	else: return None
+
+def record(phase, start, sql = None, rows = 0):
+	"""
+	Record the time since 'start' (from start()) against a phase, returning
+	it (or None if we're not timing anything).
+	"""
+	if start is None: return None
+
+	elapsed = time.time() - start
+
+	timings = getattr(current, 'timings', None)
+	if timings is None: return elapsed
+
+	timings[phase] = timings.get(phase, 0) + elapsed
+	current.rows += rows
+
+	if sql is not None:
+		current.queries.append((fingerprint(sql), elapsed))
+
+	return elapsed
+
+def record_query(start, cursor, sql, params, explain = 'EXPLAIN'):
+	"""
+	Record a statement executed on 'cursor' since 'start' and, if it was
+	slow, log it (and the plan that 'explain' + the statement shows).
+	"""
+	elapsed = record('query', start, sql = sql)
+
+	if elapsed is not None and slow_threshold is not None:
+		if elapsed >= slow_threshold:
+			log_slow_query(cursor, sql, params, elapsed, explain)
+
+
+# What the current request (i.e. this thread) has done so far.
+current = threading.local()
+
+def start_request(route = None):
+	current.route = route
+	current.timings = {} if enabled else None
+	current.queries = []
+	current.rows = 0
+	current.start = time.time()
+
+def server_timing():
+	"""
+	The current request's timings so far, as a Server-Timing header value
+	(or None if we're not instrumenting).
+	"""
+	timings = getattr(current, 'timings', None)
+	if timings is None: return None
+
+	header = [ '%s;dur=%.2f' % (phase, timings[phase] * 1000)
+		for phase in phases if phase in timings ]
+
+	header.append('db;desc="%d queries, %d rows"' % (
+		len(current.queries), current.rows))
+	header.append('total;dur=%.2f' % ((time.time() - current.start) * 1000))
+
+	return ', '.join(header)
+
+def finish_request():
+	"""
+	Add the current request's timings to the totals, returning them as a
+	Server-Timing header value (or None if we're not instrumenting).
+	"""
+	header = server_timing()
+	if header is None: return None
+
+	totals.add(current.timings, time.time() - current.start,
+		current.queries, current.rows)
+	current.timings = None
+
+	return header
+
+def finish_after(body):
+	"""
+	Wrap a streamed response body, whose queries run as it is sent, so that
+	the request is finished (and they are counted) once it has been.
+	"""
+	try:
+		for chunk in body: yield chunk
+
+	finally:
+		if hasattr(body, 'close'): body.close()
+		finish_request()
+
+
+# SQL text -> (fingerprint, normalized SQL).
+fingerprints = {}
+max_fingerprints = 1000
+
+def fingerprint(sql):
+	"""
+	A short ID for the shape of a statement, the same whatever literals it
+	contains and however many values are in its IN (...) and VALUES lists.
+	"""
+	result = fingerprints.get(sql)
+	if result is None:
+		normalized = ' '.join(sql.split())
+		normalized = re.sub("'(?:[^'\\\\]|\\\\.)*'", '?', normalized)
+		normalized = re.sub('\\b[0-9]+\\b', '?', normalized)
+		normalized = re.sub('%s(, ?%s)+', '%s...', normalized)
+		normalized = re.sub('\\(%s\\.\\.\\.\\)(, ?\\(%s\\.\\.\\.\\))+',
+			'(%s...)...', normalized)
+
+		result = (hashlib.sha1(normalized).hexdigest()[:12], normalized)
+
+		if len(fingerprints) >= max_fingerprints: fingerprints.clear()
+		fingerprints[sql] = result
+
+	return result
+
+
+def log_slow_query(cursor, sql, params, elapsed, explain):
+	""" Log a slow statement as one line of JSON. """
+	(id, normalized) = fingerprint(sql)
+
+	entry = {
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'fingerprint': id,
+		'sql': normalized,
+		'seconds': round(elapsed, 6),
+		'route': getattr(current, 'route', None),
+		'plan': plan(cursor, sql, params, explain),
+	}
+
+	rows = row_count(cursor)
+	if rows is not None: entry['rows'] = rows
+
+	slow_log.warning(json.dumps(entry, default = str))
+
+def row_count(cursor):
+	"""
+	How many rows a statement returned or changed, if its cursor knows yet:
+	an unbuffered (streaming) cursor doesn't until they've all been read,
+	and says -1 (or, from MySQLdb, 2 ** 64 - 1).
+	"""
+	rows = getattr(cursor, 'rowcount', None)
+	if rows is None or rows < 0 or rows >= 2 ** 63: return None
+	return rows
+
+def plan(cursor, sql, params, explain):
+	""" How the database runs the SELECTs in a statement (or batch). """
+	plans = []
+	params = list(params)
+
+	statements = []
+	for statement in sql.split(';\n'):
+		count = statement.count('%s')
+		(args, params) = (params[:count], params[count:])
+		if statement.lstrip().upper().startswith('SELECT'):
+			statements.append((statement, args))
+
+	if len(statements) == 0 or explain_connection is None: return plans
+
+	# Not on 'cursor's connection: a Batch's later results or a streaming
+	# cursor's rows are still waiting to be read from it.
+	try: connection = explain_connection(cursor)
+	except Exception, e: return [ { 'error': str(e) } ]
+
+	if connection is None: return plans
+
+	try:
+		c = connection.cursor()
+		for (statement, args) in statements:
+			try:
+				c.execute('%s %s' % (explain, statement), args)
+				columns = [ d[0] for d in c.description ]
+				plans += [ dict(zip(columns, row)) for row in c.fetchall() ]
+
+			except Exception, e:
+				plans.append({ 'error': str(e) })
+
+	finally:
+		connection.close()
+
+	return plans
+
+
+class Histogram:
+	""" Counts of observations in each bucket, plus their count and sum. """
+
+	def __init__(self):
+		self.counts = [ 0 ] * len(buckets)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		for (i, bound) in enumerate(buckets):
+			if value <= bound:
+				self.counts[i] += 1
+				break
+
+		self.count += 1
+		self.sum += value
+
+	def lines(self, name, labels = []):
+		lines = []
+		cumulative = 0
+		for (bound, count) in zip(buckets, self.counts):
+			cumulative += count
+			lines.append(sample(name + '_bucket',
+				labels + [ 'le="%g"' % bound ], cumulative))
+
+		lines.append(sample(name + '_bucket', labels + [ 'le="+Inf"' ],
+			self.count))
+		lines.append(sample(name + '_sum', labels, '%f' % self.sum))
+		lines.append(sample(name + '_count', labels, self.count))
+		return lines
+
+
+class Totals:
+	""" Timings aggregated over every request, for /metrics. """
+
+	def __init__(self):
+		self.lock = threading.Lock()
+
+		self.requests = Histogram()
+		self.phases = dict([ (phase, Histogram()) for phase in phases ])
+		self.queries = {}       # fingerprint -> [ SQL, count, seconds ]
+		self.rows = 0
+
+	def add(self, timings, elapsed, queries, rows):
+		with self.lock:
+			self.requests.observe(elapsed)
+			for (phase, seconds) in timings.items():
+				self.phases[phase].observe(seconds)
+
+			for ((id, sql), seconds) in queries:
+				if id not in self.queries: self.queries[id] = [ sql, 0, 0.0 ]
+				self.queries[id][1] += 1
+				self.queries[id][2] += seconds
+
+			self.rows += rows
+
+	def exposition(self, gauges = {}):
+		"""
+		Prometheus' text format, with some extra gauges: { name: [ (labels,
+		value) ] }, where 'labels' is a list of 'name="value"' strings.
+		"""
+		with self.lock:
+			lines = [ '# TYPE secconfdb_request_seconds histogram' ]
+			lines += self.requests.lines('secconfdb_request_seconds')
+
+			lines.append('# TYPE secconfdb_phase_seconds histogram')
+			for phase in phases:
+				lines += self.phases[phase].lines('secconfdb_phase_seconds',
+					[ 'phase="%s"' % phase ])
+
+			lines.append('# TYPE secconfdb_rows_total counter')
+			lines.append(sample('secconfdb_rows_total', [], self.rows))
+
+			queries = [
+				([ 'fingerprint="%s"' % id, 'sql="%s"' % escape(sql[:200]) ],
+					count, seconds)
+				for (id, (sql, count, seconds)) in sorted(self.queries.items())
+			]
+
+		# Each family's samples have to be together.
+		lines.append('# TYPE secconfdb_queries_total counter')
+		lines += [ sample('secconfdb_queries_total', labels, count)
+			for (labels, count, seconds) in queries ]
+
+		lines.append('# TYPE secconfdb_query_seconds_total counter')
+		lines += [ sample('secconfdb_query_seconds_total', labels, '%f' % seconds)
+			for (labels, count, seconds) in queries ]
+
+		for (name, samples) in sorted(gauges.items()):
+			lines.append('# TYPE %s gauge' % name)
+			lines += [ sample(name, labels, value) for (labels, value) in samples ]
+
+		return '\n'.join(lines) + '\n'
+
+totals = Totals()
+
+
+def sample(name, labels, value):
+	""" One line of Prometheus' text format (without '{}' if unlabelled). """
+	if len(labels) == 0: return '%s %s' % (name, value)
+	return '%s{%s} %s' % (name, ','.join(labels), value)
+
+def escape(label):
+	return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
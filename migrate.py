@@ -0,0 +1,131 @@
+#!/usr/bin/python
+"""
+Schema changes for the conference database.
+
+Run as 'migrate.py [username]' with an account that is allowed to create
+and alter tables. Every migration can safely be run more than once.
+"""
+
+import getpass
+import sys
+import time
+
+import db
+
+
+def conference_tags(cursor):
+	""" Tag membership as an indexed join table instead of 'tags' strings. """
+	cursor.execute("""
+		CREATE TABLE IF NOT EXISTS ConferenceTags (
+			conference INT NOT NULL,
+			tag INT NOT NULL,
+			PRIMARY KEY (tag, conference),
+			KEY (conference)
+		)
+	""")
+
+	# Backfill from Conferences.tags (which remains the editable form).
+	cursor.execute('SELECT conference, tags FROM Conferences')
+	for (conference, tags) in cursor.fetchall():
+		db.store_tags(cursor, conference, tags)
+
+
+def latest_instances(cursor):
+	""" Conferences.latestInstance, replacing a correlated max(startDate). """
+	if not has_column(cursor, 'Conferences', 'latestInstance'):
+		cursor.execute("""
+			ALTER TABLE Conferences
+				ADD COLUMN latestInstance INT NULL,
+				ADD INDEX (latestInstance)
+		""")
+
+	cursor.execute("""
+		UPDATE Conferences SET latestInstance = (
+			SELECT instance FROM ConferenceInstances AS ci
+				WHERE ci.conference = Conferences.conference
+				ORDER BY startDate DESC, instance DESC
+				LIMIT 1)
+	""")
+
+
+def effective_deadlines(cursor):
+	""" ConferenceInstances.effectiveDeadline and deadline indexes. """
+	if not has_column(cursor, 'ConferenceInstances', 'effectiveDeadline'):
+		cursor.execute("""
+			ALTER TABLE ConferenceInstances
+				ADD COLUMN effectiveDeadline DATE NULL,
+				ADD INDEX (effectiveDeadline)
+		""")
+
+	if not has_index(cursor, 'ConferenceInstances', 'posterDeadline'):
+		cursor.execute(
+			'ALTER TABLE ConferenceInstances ADD INDEX (posterDeadline)')
+
+	cursor.execute("""
+		UPDATE ConferenceInstances
+			SET effectiveDeadline = COALESCE(extendedDeadline, deadline)
+	""")
+
+
+def start_dates(cursor):
+	""" An index for paging through instances by (startDate, instance). """
+	# InnoDB secondary indexes end with the primary key (instance).
+	if not has_index(cursor, 'ConferenceInstances', 'startDate'):
+		cursor.execute('ALTER TABLE ConferenceInstances ADD INDEX (startDate)')
+
+
+def data_version(cursor):
+	""" A DataVersion row that every write bumps (see db.data_version). """
+	# Accounts that edit the data need UPDATE on this table, too.
+	cursor.execute("""
+		CREATE TABLE IF NOT EXISTS DataVersion (
+			version INT NOT NULL,
+			written INT NOT NULL
+		)
+	""")
+
+	cursor.execute('SELECT COUNT(*) FROM DataVersion')
+	if cursor.fetchone()[0] == 0:
+		cursor.execute('INSERT INTO DataVersion VALUES (0, %s)',
+			(int(time.time()),))
+
+
+def has_column(cursor, table, column):
+	cursor.execute("""
+		SELECT COUNT(*) FROM information_schema.COLUMNS
+			WHERE TABLE_SCHEMA = DATABASE()
+				AND TABLE_NAME = %s AND COLUMN_NAME = %s
+		""", (table, column))
+
+	return cursor.fetchone()[0] > 0
+
+
+def has_index(cursor, table, column):
+	cursor.execute("""
+		SELECT COUNT(*) FROM information_schema.STATISTICS
+			WHERE TABLE_SCHEMA = DATABASE()
+				AND TABLE_NAME = %s AND COLUMN_NAME = %s
+				AND SEQ_IN_INDEX = 1
+		""", (table, column))
+
+	return cursor.fetchone()[0] > 0
+
+
+migrations = [
+	conference_tags,
+	latest_instances,
+	effective_deadlines,
+	start_dates,
+	data_version,
+]
+
+
+if __name__ == '__main__':
+	username = sys.argv[1] if len(sys.argv) > 1 else 'root'
+	password = getpass.getpass('Password for %s: ' % username)
+
+	with db.cursor(username = username, password = password) as c:
+		for migration in migrations:
+			print '%s: %s' % (migration.__name__, migration.__doc__.strip())
+			migration(c)
+			c.connection.commit()
@@ -0,0 +1,181 @@
+import threading
+import time
+
+
+class PoolExhaustedException(Exception):
+	""" No connection became free before the checkout timeout expired. """
+	pass
+
+
+class Pool:
+	""" A bounded, thread-safe pool of connections for one set of credentials.
+
+	'connect' is a function which opens a new connection. Connections are
+	created lazily (up to 'max_size' of them), health-checked when they are
+	checked out after sitting idle and thrown away when they have been idle
+	for longer than 'max_idle' seconds.
+	"""
+
+	def __init__(self, connect,
+			max_size = 8, max_idle = 300, ping_after = 5, timeout = 10):
+
+		assert max_size > 0
+
+		self.connect = connect
+		self.max_size = max_size
+		self.max_idle = max_idle
+		self.ping_after = ping_after
+		self.timeout = timeout
+
+		self.lock = threading.Condition()
+		self.idle = []          # [ (connection, time it was returned) ]
+		self.size = 0           # open connections, idle or checked out
+		self.closed = False
+
+		self.checkouts = 0
+		self.connects = 0
+		self.discards = 0
+		self.waits = 0
+		self.wait_time = 0.0
+		self.max_wait = 0.0
+
+
+	def acquire(self):
+		""" Check out a healthy connection, opening one if necessary. """
+		start = time.time()
+		self._reap()
+
+		while True:
+			(connection, idle_since) = self._reserve(start)
+
+			if connection is None:
+				try: connection = self.connect()
+				except:
+					self._forget()
+					raise
+
+				with self.lock: self.connects += 1
+				return connection
+
+			if self._healthy(connection, idle_since): return connection
+			self.discard(connection)
+
+
+	def release(self, connection):
+		""" Return a connection to the pool, discarding it if it is broken. """
+
+		# Don't let one borrower's transaction (and its snapshot of the data)
+		# leak into the next borrower's queries.
+		try: connection.rollback()
+		except Exception:
+			self.discard(connection)
+			return
+
+		with self.lock:
+			if not self.closed:
+				self.idle.append((connection, time.time()))
+				self.lock.notify()
+				connection = None
+
+		if connection is not None: self.discard(connection)
+		self._reap()
+
+
+	def discard(self, connection):
+		""" Close a connection that should not be used again. """
+		try: connection.close()
+		except Exception: pass
+
+		with self.lock: self.discards += 1
+		self._forget()
+
+
+	def close(self):
+		""" Close the idle connections now and the others when released. """
+		with self.lock:
+			self.closed = True
+			(idle, self.idle) = (self.idle, [])
+
+		for (connection, idle_since) in idle: self.discard(connection)
+
+
+	def stats(self):
+		""" Pool size and wait-time statistics. """
+		with self.lock:
+			return {
+				'size': self.size,
+				'idle': len(self.idle),
+				'in_use': self.size - len(self.idle),
+				'max_size': self.max_size,
+				'checkouts': self.checkouts,
+				'connects': self.connects,
+				'discards': self.discards,
+				'waits': self.waits,
+				'wait_time': self.wait_time,
+				'max_wait': self.max_wait,
+			}
+
+
+	def _reserve(self, start):
+		"""
+		Take an idle connection or reserve room for a new one (in which case
+		the connection returned is None), waiting if the pool is full.
+		"""
+		with self.lock:
+			waited = False
+
+			while len(self.idle) == 0 and self.size >= self.max_size:
+				remaining = start + self.timeout - time.time()
+				if remaining <= 0:
+					raise PoolExhaustedException(
+						'no connection free after %g s' % self.timeout)
+
+				waited = True
+				self.lock.wait(remaining)
+
+			if waited:
+				elapsed = time.time() - start
+				self.waits += 1
+				self.wait_time += elapsed
+				self.max_wait = max(self.max_wait, elapsed)
+
+			self.checkouts += 1
+
+			if len(self.idle) > 0: return self.idle.pop()
+
+			self.size += 1
+			return (None, None)
+
+
+	def _reap(self):
+		"""
+		Close connections that have been idle for longer than 'max_idle'.
+
+		Idle connections are reused from the top of the stack, so under a
+		light load the ones at the bottom would otherwise never be looked at.
+		"""
+		stale = []
+		with self.lock:
+			now = time.time()
+			while len(self.idle) > 0 and now - self.idle[0][1] > self.max_idle:
+				stale.append(self.idle.pop(0)[0])
+
+		for connection in stale: self.discard(connection)
+
+
+	def _healthy(self, connection, idle_since):
+		idle = time.time() - idle_since
+		if idle > self.max_idle: return False
+		if idle < self.ping_after: return True
+
+		try: connection.ping()
+		except Exception: return False
+
+		return True
+
+
+	def _forget(self):
+		""" A connection has been closed (or never opened): make room. """
+		with self.lock:
+			self.size -= 1
+			self.lock.notify()
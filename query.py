@@ -1,17 +1,25 @@
 import re
 
 import event
+import metrics
 
 
 class Clause:
-	""" A clause in a SQL query (e.g. SELECT, ORDER BY, ...). """
+	"""
+	A clause in a SQL query (e.g. SELECT, ORDER BY, ...).
 
-	def __init__(self, operator, value):
+	Values are never written into the SQL text: they are passed to the
+	database separately as 'params', one for each %s in the text.
+	"""
+
+	def __init__(self, operator, value, params = ()):
 		""" 'operator' may not be None, but 'value' may. """
 		assert operator != None
+		assert value is not None or len(params) == 0
 
 		self.operator = operator
 		self.value = value
+		self.params = tuple(params)
 
 	def __str__(self):
 		if self.value is None: return ""
@@ -27,6 +35,71 @@ class Clause:
 
 
 
+class Dialect:
+	"""
+	How a database spells the things that aren't standard SQL.
+
+	Clauses are written with portable markers (e.g. DAYS_FROM_TODAY(%s) for
+	the date that many days from today), which each dialect translates.
+	"""
+
+	markers = re.compile('DAYS_FROM_TODAY\\(([^()]*)\\)')
+
+	def __init__(self, name, days_from_today, explain):
+		self.name = name
+		self.days_from_today = days_from_today
+		self.explain = explain
+
+	def translate(self, sql):
+		return Dialect.markers.sub(
+			lambda match: self.days_from_today % match.group(1), sql)
+
+	@classmethod
+	def of(cls, cursor):
+		""" The dialect spoken by a cursor's database (MySQL by default). """
+		return getattr(cursor, 'dialect', Dialect.mysql)
+
+Dialect.mysql = Dialect('mysql', 'ADDDATE(CURDATE(), %s)', 'EXPLAIN')
+Dialect.sqlite = Dialect('sqlite',
+	"date('now', 'localtime', %s || ' days')", 'EXPLAIN QUERY PLAN')
+
+
+# SQL text for each shape of query (fields, source, filter and order) in each
+# dialect, so that we only build it once.
+compiled = {}
+max_compiled = 1000
+
+def compile_sql(dialect, *parts):
+	""" Join strings and clauses into the SQL text of a query. """
+	key = (dialect.name,) + tuple([
+		(part.operator, part.value) if isinstance(part, Clause) else part
+			for part in parts
+	])
+
+	sql = compiled.get(key)
+	if sql is None:
+		sql = parts[0]
+		for part in parts[1:]: sql = sql + part
+		sql = dialect.translate(sql)
+
+		# Table names come from URLs, so don't let this grow without bound.
+		if len(compiled) >= max_compiled: compiled.clear()
+		compiled[key] = sql
+
+	return sql
+
+def run(cursor, sql, params):
+	""" Execute a statement (timing it, if metrics are enabled). """
+	start = metrics.start()
+	cursor.execute(sql, params)
+	metrics.record_query(start, cursor, sql, params,
+		Dialect.of(cursor).explain)
+
+def all_params(*clauses):
+	""" The parameters of some clauses, in order. """
+	return sum([ clause.params for clause in clauses ], ())
+
+
 class Fields(Clause):
 	""" Table fields that we wish to refer to (e.g. to SELECT on). """
 
@@ -38,7 +111,17 @@ class Fields(Clause):
 		Clause.__init__(self, "", ",".join(fields))
 
 	def names(self):
-		return [ re.sub(".* AS ", "", name) for name in self.fields ]
+		return [ re.sub("(?s).* AS ", "", name) for name in self.fields ]
+
+	def project(self, names):
+		""" Just the named fields (which must all be among these fields). """
+		by_name = dict(zip(self.names(), self.fields))
+
+		unknown = [ name for name in names if name not in by_name ]
+		if len(unknown) > 0:
+			raise ValueError, "No such field(s): %s" % ', '.join(unknown)
+
+		return Fields([ by_name[name] for name in names ])
 
 	@classmethod
 	def conference(cls):
@@ -48,6 +131,26 @@ class Fields(Clause):
 				'permanentURL AS url', '`meeting-type` AS type_id', 'tags'
 			])
 
+	@classmethod
+	def conference_page(cls):
+		""" A conference, its parent (as parent_*) and its tags' names. """
+		columns = [
+			('conference', 'conference'), ('parent', 'parent'),
+			('name', 'name'), ('abbreviation', 'abbreviation'),
+			('description', 'description'), ('permanentURL', 'url'),
+			('`meeting-type`', 'type_id'), ('tags', 'tags'),
+		]
+
+		return Fields(
+			[ 'Conferences.%s AS %s' % c for c in columns ]
+			+ [ 'Parents.%s AS parent_%s' % c for c in columns ]
+			+ [
+				"""(SELECT GROUP_CONCAT(Tags.name)
+					FROM ConferenceTags INNER JOIN Tags USING (tag)
+					WHERE ConferenceTags.conference = Conferences.conference
+				) AS tag_names"""
+			])
+
 	@classmethod
 	def events(cls):
 		return Fields(
@@ -87,23 +190,26 @@ class Values(Clause):
 		assert values != None
 		assert len(values) > 0
 
-		# Put single quotes around strings, convert None to SQL-friendly NULL.
-		for (name, value) in values.items():
-			if value is None: values[name] = 'NULL'
-			elif isinstance(value, basestring): values[name] = "'%s'" % value
-
+		# The database driver quotes strings and converts None to NULL.
 		formatted_values = None
 		if action == 'SET':
 			formatted_values = ', '.join([
-					'%s = %s' % (name, value) for (name, value) in values.items() ])
+					'%s = %%s' % name for name in values.keys() ])
+
+		elif action == 'VALUES' and isinstance(values, list):
+			# Several rows, each a sequence of values (in the fields' order).
+			row = '(%s)' % ', '.join([ '%s' ] * len(values[0]))
+			Clause.__init__(self, action, ', '.join([ row ] * len(values)),
+				sum([ tuple(v) for v in values ], ()))
+			return
 
 		elif action == 'VALUES':
-			formatted_values = '(%s)' % ', '.join(values.values())
+			formatted_values = '(%s)' % ', '.join([ '%s' ] * len(values))
 
 		else:
 			raise ValueError, "Unknown action '%s'" % action
 
-		Clause.__init__(self, action, formatted_values)
+		Clause.__init__(self, action, formatted_values, values.values())
 
 
 class Tables(Clause):
@@ -116,6 +222,12 @@ class Tables(Clause):
 	def conference(cls):
 		return Tables("Conferences")
 
+	@classmethod
+	def conference_page(cls):
+		return Tables("""Conferences
+			LEFT JOIN Conferences AS Parents
+				ON (Parents.conference = Conferences.parent)""")
+
 	@classmethod
 	def events(cls):
 		return Tables("""ConferenceInstances
@@ -136,20 +248,70 @@ class Tables(Clause):
 class Filter(Clause):
 	""" A filter which restricts a query (e.g. WHERE foo > 42). """
 
-	def __init__(self, value):
-		Clause.__init__(self, "WHERE", value)
+	def __init__(self, value, params = ()):
+		Clause.__init__(self, "WHERE", value, params)
 
 	def __and__(self, other):
 		if self.value is None: return other
 		if other.value is None: return self
 
-		return Filter('(%s) AND (%s)' % (self.value, other.value))
+		return Filter('(%s) AND (%s)' % (self.value, other.value),
+			self.params + other.params)
+
+	def __or__(self, other):
+		if self.value is None: return self
+		if other.value is None: return other
+
+		return Filter('(%s) OR (%s)' % (self.value, other.value),
+			self.params + other.params)
+
+	@classmethod
+	def equals(cls, field, value):
+		return Filter('%s = %%s' % field, [ value ])
+
+	@classmethod
+	def one_of(cls, field, values):
+		if len(values) == 0: return Filter('0 = 1')
+		return Filter('%s IN (%s)' % (field, ','.join([ '%s' ] * len(values))),
+			values)
+
+	@classmethod
+	def latest(cls):
+		""" Only the most recent instance of each conference. """
+		return Filter("instance = latestInstance")
 
 	@classmethod
 	def by_date(cls, min_days, max_days):
 		return Filter(
-			"startDate BETWEEN ADDDATE(CURDATE(), %d) AND ADDDATE(CURDATE(), %d)"
-			% (min_days, max_days))
+			"startDate BETWEEN DAYS_FROM_TODAY(%s) AND DAYS_FROM_TODAY(%s)",
+			[ min_days, max_days ])
+
+	@classmethod
+	def start_dates(cls, first = None, last = None):
+		""" Events starting between two dates (either of which may be None). """
+		f = Filter(None)
+		if first is not None: f = f & Filter('startDate >= %s', [ first ])
+		if last is not None: f = f & Filter('startDate <= %s', [ last ])
+		return f
+
+	@classmethod
+	def after(cls, columns, values):
+		"""
+		Rows that come after 'values' when ordered by 'columns' (for keyset
+		pagination), e.g. (a > 1) OR (a = 1 AND b > 2). Unlike OFFSET, this
+		lets the database seek straight to the first row of a page.
+		"""
+		assert len(columns) == len(values) and len(columns) > 0
+
+		terms = []
+		for i in range(len(columns)):
+			terms.append((
+				' AND '.join([ '%s = %%s' % c for c in columns[:i] ]
+					+ [ '%s > %%s' % columns[i] ]),
+				list(values[:i + 1])))
+
+		return Filter(' OR '.join([ '(%s)' % t for (t, p) in terms ]),
+			sum([ p for (t, p) in terms ], []))
 
 	@classmethod
 	def recent(cls):
@@ -161,21 +323,24 @@ class Filter(Clause):
 
 	@classmethod
 	def upcomingDeadlines(cls):
+		# Compare the (indexed) columns themselves, not functions of them,
+		# so that MySQL can use range scans.
 		return Filter("""
-	(DATEDIFF(deadline, CURDATE()) >= -14)
-	OR (DATEDIFF(extendedDeadline, CURDATE()) >= -14)
-	OR (DATEDIFF(posterDeadline, CURDATE()) >= -14)
-	""")
+	(effectiveDeadline >= DAYS_FROM_TODAY(%s))
+	OR (posterDeadline >= DAYS_FROM_TODAY(%s))
+	""", [ -14, -14 ])
 
 
 	@classmethod
 	def tags(cls, tags):
 		if len(tags) == 0: return Filter(None)
 
-		match = "tags REGEXP '([0-9]+,)*%d(,[0-9]+)*'"
-		sql = ' OR '.join([ match % i for i in tags ])
-
-		return Filter("(%s)" % sql)
+		# Look conferences up in the (indexed) ConferenceTags table rather
+		# than pattern-matching the comma-separated Conferences.tags column.
+		return Filter(
+			"conference IN (SELECT conference FROM ConferenceTags"
+			" WHERE tag IN (%s))" % ','.join([ '%s' ] * len(tags)),
+			[ int(i) for i in tags ])
 
 
 class Order(Clause):
@@ -191,16 +356,14 @@ class Order(Clause):
 
 	@classmethod
 	def deadline(cls):
+		"""
+		The paper deadline (extended, if it has been), or the poster deadline
+		once the paper deadline is more than two weeks past.
+		"""
 		return Order("""
 CASE
-        WHEN (DATEDIFF(deadline, CURDATE()) < -14)
-              AND (extendedDeadline IS NULL
-                   OR (DATEDIFF(extendedDeadline, CURDATE()) < -14))
-                THEN
-                        posterDeadline
-
-        WHEN extendedDeadline IS NULL THEN deadline
-        ELSE extendedDeadline
+        WHEN effectiveDeadline < DAYS_FROM_TODAY(-14) THEN posterDeadline
+        ELSE effectiveDeadline
         END
 """)
 
@@ -209,6 +372,14 @@ CASE
 		return Order("location")
 
 
+class Limit(Clause):
+	""" A maximum number of results (or None for no limit). """
+
+	def __init__(self, count):
+		if count is None: Clause.__init__(self, "LIMIT", None)
+		else: Clause.__init__(self, "LIMIT", "%s", [ int(count) ])
+
+
 class Select:
 	""" Get data from the database. """
 
@@ -216,33 +387,82 @@ class Select:
 			filter,
 			order = Order.start_date(),
 			fields = Fields.events(),
-			source = Tables.events()):
+			source = Tables.events(),
+			limit = Limit(None)):
 
 		self.where = filter
 		self.order = order
 		self.fields = fields
 		self.source = source
+		self.limit = limit
 
 	def execute(self, cursor):
-		cursor.execute(self.__str__())
-		results = cursor.fetchall()
+		return list(self.iterate(cursor))
+
+	def iterate(self, cursor, batch_size = 100):
+		""" Generate results as they are fetched from the cursor. """
+		run(cursor, self.sql(Dialect.of(cursor)), self.params())
+		return self.results(cursor, batch_size)
 
-		conferences = []
+	def results(self, cursor, batch_size = 100):
+		""" Generate results from the cursor's current result set. """
 
 		# Use field names (either from the query, or, in the 'SELECT *' case,
-		# from the DB cursor) to construct a dictionary of values.
+		# from the DB cursor) to choose a class for the rows.
 		field_names = self.fields.names()
 		if len(field_names) == 1 and field_names[0] == '*':
 			field_names = [ i[0] for i in cursor.description ]
 
-		for result in results:
-			conferences.append(
-				event.Event(dict(zip(field_names, result))))
+		row = event.row_class(field_names)
+
+		while True:
+			start = metrics.start()
+			results = cursor.fetchmany(batch_size)
+			metrics.record('fetch', start)
+			if len(results) == 0: break
+
+			start = metrics.start()
+			rows = [ row(*result) for result in results ]
+			metrics.record('rows', start, rows = len(rows))
 
-		return conferences
+			for r in rows: yield r
+
+	def params(self):
+		return all_params(
+			self.fields, self.source, self.where, self.order, self.limit)
+
+	def sql(self, dialect = Dialect.mysql):
+		return compile_sql(dialect, "SELECT",
+			self.fields, self.source, self.where, self.order, self.limit)
 
 	def __str__(self):
-		return "SELECT" + self.fields + self.source + self.where + self.order
+		return self.sql()
+
+
+class Batch:
+	""" Several Selects, sent to the database together in one round trip. """
+
+	def __init__(self, *queries):
+		self.queries = queries
+
+	def execute(self, cursor):
+		""" Run the queries, returning a list of results for each. """
+		dialect = Dialect.of(cursor)
+		run(cursor,
+			';\n'.join([ q.sql(dialect) for q in self.queries ]),
+			sum([ q.params() for q in self.queries ], ()))
+
+		results = []
+		for query in self.queries:
+			results.append(list(query.results(cursor)))
+			cursor.nextset()
+
+		return results
+
+
+def encoded_size(value):
+	if isinstance(value, unicode): return len(value.encode('utf8'))
+	return len(str(value))
 
 
 class Update:
@@ -253,12 +473,19 @@ class Update:
 		self.values = values
 		self.filter = filter
 
-	def execute(self, cursor):
-		cursor.execute(self.__str__())
-		cursor.connection.commit()
+	def execute(self, cursor, commit = True):
+		run(cursor, self.sql(Dialect.of(cursor)), self.params())
+		if commit: cursor.connection.commit()
+
+	def params(self):
+		return all_params(self.table, self.values, self.filter)
+
+	def sql(self, dialect = Dialect.mysql):
+		return compile_sql(dialect,
+			"UPDATE", self.table, self.values, self.filter)
 
 	def __str__(self):
-		return "UPDATE" + self.table + self.values + self.filter
+		return self.sql()
 
 class Insert:
 	""" Insert a new entry into the database. """
@@ -268,10 +495,47 @@ class Insert:
 		self.fields = fields
 		self.values = values
 
-	def execute(self, cursor):
-		cursor.execute(self.__str__())
-		cursor.connection.commit()
+	@classmethod
+	def rows(cls, table, fields, rows, max_size = 1024 * 1024):
+		"""
+		Generate Inserts for many rows (sequences of values in the order of
+		'fields'), each of as many rows as will fit in a 'max_size'-byte
+		statement (MySQL's limit is max_allowed_packet).
+		"""
+		base = 100 + len(str(table)) + len(str(fields))
+
+		chunk = []
+		size = base
+		for row in rows:
+			# Values are sent quoted and (at worst) with every byte escaped.
+			row_size = sum([ 2 * encoded_size(v) + 4 for v in row ])
+
+			if len(chunk) > 0 and size + row_size > max_size:
+				yield Insert(table, fields, Values('VALUES', chunk))
+				(chunk, size) = ([], base)
+
+			chunk.append(row)
+			size += row_size
+
+		if len(chunk) > 0: yield Insert(table, fields, Values('VALUES', chunk))
+
+	def execute(self, cursor, commit = True):
+		"""
+		Insert the row(s), returning the auto-generated ID (if any) of the
+		first one.
+		"""
+		run(cursor, self.sql(Dialect.of(cursor)), self.params())
+		if commit: cursor.connection.commit()
+
+		return cursor.lastrowid
+
+	def params(self):
+		return all_params(self.table, self.fields, self.values)
+
+	def sql(self, dialect = Dialect.mysql):
+		return compile_sql(dialect,
+			"INSERT INTO", self.table, '(', self.fields, ')', self.values)
 
 	def __str__(self):
-		return "INSERT INTO" + self.table + '(' + self.fields + ')' + self.values
+		return self.sql()
 
@@ -0,0 +1,78 @@
+-- The conference database schema, in SQLite's dialect (see backend.SQLite).
+
+CREATE TABLE Countries (
+	country INTEGER PRIMARY KEY,
+	code TEXT NOT NULL,
+	name TEXT NOT NULL
+);
+
+CREATE TABLE Regions (
+	region INTEGER PRIMARY KEY,
+	country INTEGER NOT NULL,
+	code TEXT NOT NULL,
+	name TEXT NOT NULL
+);
+
+CREATE TABLE Locations (
+	location INTEGER PRIMARY KEY,
+	name TEXT NOT NULL,
+	region INTEGER,
+	country INTEGER
+);
+
+CREATE TABLE Tags (
+	tag INTEGER PRIMARY KEY,
+	name TEXT NOT NULL
+);
+
+CREATE TABLE MeetingTypes (
+	`meeting-type` INTEGER PRIMARY KEY,
+	name TEXT NOT NULL
+);
+
+CREATE TABLE Conferences (
+	conference INTEGER PRIMARY KEY,
+	parent INTEGER,
+	name TEXT NOT NULL,
+	abbreviation TEXT NOT NULL,
+	description TEXT,
+	permanentURL TEXT,
+	`meeting-type` INTEGER,
+	tags TEXT,
+	latestInstance INTEGER
+);
+CREATE UNIQUE INDEX ConferenceAbbreviations ON Conferences (abbreviation);
+CREATE INDEX ConferenceLatestInstances ON Conferences (latestInstance);
+
+CREATE TABLE ConferenceTags (
+	conference INTEGER NOT NULL,
+	tag INTEGER NOT NULL,
+	PRIMARY KEY (tag, conference)
+);
+CREATE INDEX ConferenceTagsByConference ON ConferenceTags (conference);
+
+CREATE TABLE ConferenceInstances (
+	instance INTEGER PRIMARY KEY,
+	conference INTEGER NOT NULL,
+	url TEXT,
+	startDate DATE NOT NULL,
+	endDate DATE NOT NULL,
+	deadline DATE,
+	extendedDeadline DATE,
+	posterDeadline DATE,
+	effectiveDeadline DATE,
+	location INTEGER NOT NULL,
+	proceedings TEXT
+);
+CREATE INDEX InstancesByConference ON ConferenceInstances (conference);
+CREATE INDEX InstancesByStartDate ON ConferenceInstances (startDate);
+CREATE INDEX InstancesByDeadline ON ConferenceInstances (effectiveDeadline);
+CREATE INDEX InstancesByPosterDeadline ON ConferenceInstances (posterDeadline);
+
+-- Bumped by every write, so that every process can tell when the data have
+-- changed (see db.data_version).
+CREATE TABLE DataVersion (
+	version INTEGER NOT NULL,
+	written INTEGER NOT NULL
+);
+INSERT INTO DataVersion VALUES (0, 0);
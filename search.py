@@ -0,0 +1,238 @@
+"""
+Conference search, from an in-memory inverted index.
+
+Every conference is indexed by the words in its abbreviation, name,
+description, tag names and the names of the places it has been held, with
+some fields counting for more than others. Queries match whole words or
+(for typeahead) word prefixes, and results are ranked by how much of each
+conference matched.
+
+The index is built once per process and kept up to date by a db.on_write
+hook, which re-indexes just the conference that was written where it can.
+Writes by other processes (e.g. bulk_import.py) change the shared data
+version (see db.current_version), which makes the index rebuild itself.
+"""
+
+import bisect
+import heapq
+import re
+import threading
+import time
+
+import db
+from query import Batch, Fields, Filter, Order, Select, Tables
+
+
+# How much a word counts for, depending on where it was found.
+weights = {
+	'abbreviation': 10,
+	'name': 5,
+	'tags': 3,
+	'locations': 2,
+	'description': 1,
+}
+
+# A prefix match counts for this fraction of a whole-word match.
+prefix_weight = 0.5
+
+
+def words(text):
+	""" The (lower-case, Unicode) words in a UTF-8 string. """
+	if text is None: return []
+	if not isinstance(text, unicode): text = text.decode('utf8', 'replace')
+	return re.findall('\w+', text.lower(), re.UNICODE)
+
+
+class Index:
+	"""
+	Conferences by the words that describe them.
+
+	The index is rebuilt (when next used) once the shared data version
+	shows a write that it hasn't seen or it is 'max_age' seconds old.
+	"""
+
+	def __init__(self, max_age = 600):
+		self.max_age = max_age
+		self.lock = threading.Lock()
+		self.building = threading.Lock()
+
+		self.built = None
+		self.version = None     # the data version it was built from
+		self.postings = {}      # word -> { conference ID: weight }
+		self.terms = []         # every word in 'postings', sorted
+		self.documents = {}     # conference ID -> (summary, { word: weight })
+
+		db.on_write(self.written)
+
+
+	def build(self):
+		""" (Re-)index every conference. """
+		(version, written) = db.current_version()
+		documents = load()
+
+		with self.lock:
+			(self.postings, self.terms, self.documents) = ({}, [], {})
+			for (id, document) in documents.items(): self._add(id, document)
+			(self.built, self.version) = (time.time(), version)
+
+	def search(self, query, limit = 10):
+		"""
+		The best 'limit' matches for the words in 'query', as dictionaries
+		(abbreviation, name and score), best first. Each word must match.
+		"""
+		query = words(query)
+		if len(query) == 0: return []
+
+		self.refresh()
+
+		with self.lock:
+			scores = None
+			for word in query:
+				matches = self._matches(word)
+				if scores is None: scores = matches
+				else: scores = dict([ (id, scores[id] + score)
+					for (id, score) in matches.items() if id in scores ])
+
+			best = heapq.nsmallest(limit, scores.items(),
+				key = lambda (id, score):
+					(-score, self.documents[id][0]['abbreviation']))
+
+			return [ dict(self.documents[id][0], score = score)
+				for (id, score) in best ]
+
+
+	def stale(self):
+		(version, written) = db.current_version()
+		return (self.built is None or version != self.version
+			or time.time() - self.built > self.max_age)
+
+	def refresh(self):
+		"""
+		Rebuild the index if it's stale, in one thread at a time. Others
+		use the index as it is meanwhile, unless it has to be rebuilt
+		before it can be used (e.g. after a write that we couldn't index).
+		"""
+		if not self.stale(): return
+		if not self.building.acquire(self.built is None): return
+
+		try:
+			if self.stale(): self.build()
+		finally:
+			self.building.release()
+
+
+	def written(self, table_name, key):
+		if self.built is None: return
+
+		if table_name not in ('Conferences', 'ConferenceInstances',
+				'Tags', 'Locations', 'Regions', 'Countries'):
+			return
+
+		# Re-index one conference if we know which; otherwise, everything.
+		if key is None or table_name not in ('Conferences', 'ConferenceInstances'):
+			self.built = None
+			return
+
+		# We can only catch up with this write if it's the only one we've missed.
+		(version, written) = db.current_version()
+		if version not in (self.version, self.version + 1):
+			self.built = None
+			return
+
+		if table_name == 'ConferenceInstances': id = db.instance_conference(key)
+		else: id = key
+
+		documents = load(Filter.equals('conference', id))
+
+		with self.lock:
+			self._remove(id)
+			if id in documents: self._add(id, documents[id])
+			self.version = version
+
+
+	def _matches(self, word):
+		""" { conference ID: score } for the words that 'word' matches. """
+		matches = {}
+
+		start = bisect.bisect_left(self.terms, word)
+		for term in self.terms[start:]:
+			if not term.startswith(word): break
+
+			factor = 1 if term == word else prefix_weight
+			for (id, weight) in self.postings[term].items():
+				matches[id] = max(matches.get(id, 0), factor * weight)
+
+		return matches
+
+	def _add(self, id, document):
+		self.documents[id] = document
+		for (word, weight) in document[1].items():
+			if word not in self.postings:
+				self.postings[word] = {}
+				bisect.insort(self.terms, word)
+
+			self.postings[word][id] = weight
+
+	def _remove(self, id):
+		if id not in self.documents: return
+
+		for word in self.documents.pop(id)[1]:
+			del self.postings[word][id]
+			if len(self.postings[word]) == 0:
+				del self.postings[word]
+				del self.terms[bisect.bisect_left(self.terms, word)]
+
+
+def load(filter = Filter(None)):
+	"""
+	Documents for the conferences that match a filter: { ID: (summary,
+	{ word: weight }) }, where a word's weight is that of the most
+	important field it appears in.
+	"""
+	tags = dict(db.get_tags())
+
+	# Neither query depends on the other, so send them in one round trip.
+	with db.cursor() as c:
+		(conferences, places) = Batch(
+			Select(
+				fields = Fields.conference(),
+				source = Tables.conference(),
+				filter = filter,
+				order = Order(None)),
+			Select(
+				fields = Fields.events().project(
+					[ 'conference', 'location', 'region', 'country' ]),
+				source = Tables.events(),
+				filter = filter,
+				order = Order(None))
+		).execute(c)
+
+	locations = {}
+	for place in places:
+		locations.setdefault(place.conference, set()).update(
+			[ place.location, place.region, place.country ])
+
+	documents = {}
+	for c in conferences:
+		fields = {
+			'abbreviation': c.abbreviation,
+			'name': c.name,
+			'description': c.description,
+			'tags': ' '.join([ tags.get(int(t), '')
+				for t in (c.tags or '').split(',') if t ]),
+			'locations': ' '.join([ l for l in
+				locations.get(c.conference, []) if l is not None ]),
+		}
+
+		index = {}
+		for (field, text) in fields.items():
+			for word in words(text):
+				index[word] = max(index.get(word, 0), weights[field])
+
+		summary = { 'abbreviation': c.abbreviation, 'name': c.name }
+		documents[c.conference] = (summary, index)
+
+	return documents
+
+
+index = Index()
@@ -1,5 +1,12 @@
 import datetime
 import flask
+import functools
+import hashlib
+import werkzeug.http
+
+import db
+import metrics
+import vcal
 
 
 def soonness(date, thresholds = [ 0, 7, 28, 90 ]):
@@ -13,6 +20,9 @@ def soonness(date, thresholds = [ 0, 7, 28, 90 ]):
 
 	return ""
 
+# What to filter conferences by if the user hasn't chosen.
+default_tags = [ 'security', 'privacy', 'crypto' ]
+
 def tags():
 	""" The names of the tags currently being used to filter conferences. """
 	if flask.request.cookies.has_key('tags'):
@@ -20,17 +30,70 @@ def tags():
 		if len(cookie) == 0: return []
 		return sorted(cookie.split(','))
 
-	return [ 'security', 'privacy', 'crypto' ]
+	return default_tags
 
 
 def one_day():
 	return datetime.timedelta(1)
 
 
+def render_template(name, **context):
+	""" flask.render_template, timed (if metrics are enabled). """
+	start = metrics.start()
+	page = flask.render_template(name, **context)
+	metrics.record('render', start)
+	return page
+
+
 def make_vcal(events, title):
-	""" Create a vCal file from a list of events. """
-	return flask.Response(
-		response = flask.render_template('vcal',
-			events = events, title = title, datetime = datetime),
-		mimetype = 'text/plain')
+	""" Stream a vCal file from an iterable of events. """
+	(version, modified) = db.data_version()
+	return vcal_response(vcal.calendar(events, title, modified))
+
+def vcal_response(body):
+	return flask.Response(response = body, mimetype = 'text/plain')
+
+def json_response(body):
+	return flask.Response(response = body, mimetype = 'application/json')
+
+
+
+def conditional(vary = None):
+	"""
+	Decorator which answers conditional GETs (If-None-Match/If-Modified-Since)
+	with 304 Not Modified, without running the view, if the data haven't
+	changed since the client's copy was generated.
+
+	'vary' is an optional function returning anything other than the URL
+	that the response depends on (e.g. the user's tags).
+	"""
+	def decorator(f):
+		@functools.wraps(f)
+		def decorated(*args, **kwargs):
+			(stamp, modified) = db.data_version()
+			depends_on = vary() if vary else None
+
+			etag = hashlib.sha1(
+				repr((stamp, flask.request.path, depends_on))).hexdigest()
+			last_modified = datetime.datetime.utcfromtimestamp(int(modified))
+
+			if werkzeug.http.is_resource_modified(flask.request.environ,
+					etag = etag, last_modified = last_modified):
+				response = flask.make_response(f(*args, **kwargs))
+				if response.status_code != 200: return response
+			else:
+				response = flask.Response(status = 304)
+
+			response.set_etag(etag)
+			response.last_modified = last_modified
+			if vary: response.vary.add('Cookie')
+
+			return response
+
+		return decorated
+	return decorator
+
 
+def front_page_variant():
+	""" What (besides the data) the front page depends on. """
+	return (tags(), flask.request.host)
@@ -0,0 +1,95 @@
+"""
+Streaming iCalendar (RFC 5545) output.
+
+Events are (summary, description, location, dates) tuples, where 'dates' is
+either a single date or a (start, end) pair of dates.
+"""
+
+import datetime
+import hashlib
+
+
+def escape(value):
+	""" Escape a TEXT value (RFC 5545, section 3.3.11). """
+	if value is None: return u''
+	if isinstance(value, str): value = value.decode('utf8')
+
+	return (value
+		.replace(u'\\', u'\\\\')
+		.replace(u';', u'\\;')
+		.replace(u',', u'\\,')
+		.replace(u'\r\n', u'\\n')
+		.replace(u'\n', u'\\n'))
+
+
+def fold(line):
+	"""
+	Fold a UTF-8 content line into pieces of at most 75 octets (RFC 5545,
+	section 3.1), without splitting multi-byte characters.
+	"""
+	pieces = []
+	limit = 75
+
+	while len(line) > limit:
+		cut = limit
+		while ord(line[cut]) & 0xC0 == 0x80: cut -= 1
+
+		pieces.append(line[:cut])
+		line = line[cut:]
+
+		# Continuation lines start with a space, which counts towards the limit.
+		limit = 74
+
+	pieces.append(line)
+	return '\r\n '.join(pieces) + '\r\n'
+
+
+def line(name, value):
+	if isinstance(value, str): value = value.decode('utf8')
+	return fold((u'%s:%s' % (name, value)).encode('utf8'))
+
+
+def calendar(events, title, modified = None):
+	"""
+	Generate a calendar, one VEVENT at a time, from an iterable of events.
+
+	Events are stamped with when the data were last modified (in seconds
+	since the epoch), if given, so that the same data give the same file.
+	"""
+	if modified is None: stamp = datetime.datetime.utcnow()
+	else: stamp = datetime.datetime.utcfromtimestamp(int(modified))
+	stamp = stamp.strftime('%Y%m%dT%H%M%SZ')
+
+	yield ''.join([
+		line('BEGIN', 'VCALENDAR'),
+		line('VERSION', '2.0'),
+		line('METHOD', 'PUBLISH'),
+		line('PRODID', u'-//securityconferences.net//%s//EN' % escape(title)),
+		line('X-WR-CALNAME', escape(title)),
+	])
+
+	for (summary, description, location, dates) in events:
+		if isinstance(dates, datetime.date): (start, end) = (dates, dates)
+		else: (start, end) = dates
+
+		uid = hashlib.sha1(
+			'%s/%s' % (escape(summary).encode('utf8'), start)).hexdigest()
+
+		event = [
+			line('BEGIN', 'VEVENT'),
+			line('UID', '%s@securityconferences.net' % uid),
+			line('DTSTAMP', stamp),
+			line('SUMMARY', escape(summary)),
+			line('DESCRIPTION', escape(description)),
+			line('LOCATION', escape(location)),
+			line('DTSTART;VALUE=DATE', start.strftime('%Y%m%d')),
+		]
+
+		if end != start:
+			event.append(line('DTEND;VALUE=DATE',
+				(end + datetime.timedelta(1)).strftime('%Y%m%d')))
+
+		event.append(line('END', 'VEVENT'))
+		yield ''.join(event)
+
+	yield line('END', 'VCALENDAR')